@@ -0,0 +1,42 @@
+import collections
+import multiprocessing
+import os
+
+
+def render_batch(render, targets, processes=None, window=None):
+    """Call ``render(target)`` for every target and yield the results.
+
+    The targets are handed out one at a time to a pool of forked worker
+    processes.  Because the workers are forked, everything the parent
+    loaded before the call (catalogs, cached apparent positions) is
+    shared with them copy-on-write instead of being loaded again in each
+    worker.  ``processes`` defaults to the number of CPUs; pass 1 to
+    render in the current process.
+
+    Results are yielded in the order of ``targets``.  At most ``window``
+    targets, by default twice the number of processes, are in flight or
+    waiting to be yielded at any time, so a slow consumer holds up the
+    workers instead of piling up their results in memory.
+
+    """
+    targets = list(targets)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = min(processes, len(targets))
+
+    if processes <= 1:
+        for target in targets:
+            yield render(target)
+        return
+
+    if window is None:
+        window = 2 * processes
+    context = multiprocessing.get_context('fork')
+    with context.Pool(processes) as pool:
+        pending = collections.deque()
+        for target in targets:
+            if len(pending) >= window:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(render, (target,)))
+        while pending:
+            yield pending.popleft().get()
@@ -0,0 +1,252 @@
+"""Per-stage benchmarks for the chart pipeline.
+
+Runs the stages of starmap.py (all-sky chart) and map_16degrees.py
+(finder charts), through the steps those scripts are built from, against
+fixed fixtures and without any network access:
+
+* a seeded synthetic Hipparcos-sized star catalog and Stellarium-format
+  DSO catalog, written to a temporary catalog cache;
+* the constellation figures, star names and borders under ``data/``;
+* the ``de421.bsp`` ephemeris that ships with the skyfield-data package.
+
+For every scenario it reports the wall time of each stage (best of
+``--repeat`` runs), and from one extra run under ``tracemalloc`` the
+peak traced memory and the net number of allocated blocks.  The results
+are also written as JSON so that runs can be compared over time::
+
+    python benchmark.py --output bench_results.json
+
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from skyfield.api import Loader, load, wgs84, N, E
+from skyfield.data import stellarium
+from skyfield_data import get_skyfield_data_path
+
+import catalog_cache
+import constellation_bounds
+import constellation_centers
+import dsos
+import starmap
+from constellation_figures import ConstellationFigures
+from map_16degrees import FinderCharts
+from solar_system import SolarSystem
+from starmap import ZenithSky
+
+FIXTURE_STARS = 118322
+FIXTURE_DSOS = 2000
+FIXTURE_MESSIER = 110
+
+
+class Stages:
+    """Accumulate wall time, peak memory and allocations per stage."""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    @contextmanager
+    def __call__(self, name):
+        blocks = sys.getallocatedblocks()
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stage = self.results.setdefault(name, {
+                'seconds': 0.0, 'calls': 0, 'peak_bytes': 0, 'allocated_blocks': 0,
+            })
+            stage['seconds'] += elapsed
+            stage['calls'] += 1
+            stage['allocated_blocks'] += sys.getallocatedblocks() - blocks
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - base
+                stage['peak_bytes'] = max(stage['peak_bytes'], peak)
+
+
+def synthetic_hipparcos(seed=1):
+    """A Hipparcos-shaped catalog with a realistic magnitude distribution."""
+    from pandas import DataFrame, Index
+    rng = np.random.default_rng(seed)
+    n = FIXTURE_STARS
+    ra = rng.uniform(0.0, 360.0, n)
+    return DataFrame({
+        'magnitude': np.maximum(13.0 - rng.exponential(1.5, n), -1.5),
+        'ra_degrees': ra,
+        'dec_degrees': np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, n))),
+        'parallax_mas': rng.uniform(0.0, 50.0, n),
+        'ra_mas_per_year': rng.normal(0.0, 20.0, n),
+        'dec_mas_per_year': rng.normal(0.0, 20.0, n),
+        'ra_hours': ra / 15.0,
+        'epoch_year': 1991.25,
+    }, index=Index(np.arange(1, n + 1), name='hip'))
+
+
+def write_synthetic_dsos(path, seed=2):
+    """Write a Stellarium-format catalog.txt with numbered M/NGC objects."""
+    rng = np.random.default_rng(seed)
+    with open(path, 'w') as f:
+        f.write('# synthetic benchmark fixture\n')
+        for i in range(FIXTURE_DSOS):
+            columns = ['0'] * len(dsos._COLUMN_NAMES)
+            columns[0] = str(i + 1)
+            columns[1] = '%.5f' % rng.uniform(0.0, 360.0)
+            columns[2] = '%.5f' % np.degrees(np.arcsin(rng.uniform(-1.0, 1.0)))
+            columns[3] = '%.2f' % rng.uniform(3.0, 14.0)
+            columns[4] = '%.2f' % rng.uniform(3.0, 14.0)
+            columns[16] = str(i + 1)
+            if i < FIXTURE_MESSIER:
+                columns[18] = str(i + 1)
+            f.write('\t'.join(columns) + '\n')
+
+
+class Fixtures:
+    """Set up the offline catalogs, ephemeris and epoch for the scenarios."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.environ['STARMAP_CACHE'] = os.path.join(directory, 'cache')
+        catalog_cache.save_columns('hipparcos',
+                                  catalog_cache.sort_by_magnitude(synthetic_hipparcos()))
+        self.dso_path = os.path.join(directory, 'catalog.txt')
+        write_synthetic_dsos(self.dso_path)
+
+        self.eph = Loader(get_skyfield_data_path())('de421.bsp')
+        self.earth = self.eph['earth']
+        self.solar_system = SolarSystem(self.eph)
+        ts = load.timescale(builtin=True)
+        self.t = ts.utc(2022, 1, 19, 21, 0, 0)
+        self.site = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28)
+
+    def load_catalogs(self):
+        stardata = catalog_cache.load_hipparcos()
+        dsodata = dsos.load_catalog(self.dso_path)
+        with open('data/constellationship.fab', 'rb') as f:
+            figures = ConstellationFigures(stellarium.parse_constellations(f), stardata)
+        with open('data/star_names.fab', 'rb') as f:
+            starnames = dict(stellarium.parse_star_names(f))
+        return stardata, dsodata, figures, starnames
+
+
+def finder_charts(fx, stages, count, output):
+    """The finder-chart batch of map_16degrees.py, for ``count`` targets."""
+    with stages('load'):
+        stardata, dsodata, figures, starnames = fx.load_catalogs()
+
+    with stages('astrometry'):
+        charts = FinderCharts(fx.earth, fx.t, stardata, dsodata, figures, directory=output)
+
+    for n in range(min(count, len(charts))):
+        charts.render_chart(n, stage=stages)
+    charts.chart_template().close()
+
+
+def all_sky(fx, stages, output):
+    """The zenith chart of starmap.py."""
+    with stages('load'):
+        stardata, dsodata, figures, starnames = fx.load_catalogs()
+        constdata = constellation_bounds.load_boundaries()
+        with open('data/centers_18.txt') as fc:
+            centersdata = constellation_centers.load_dataframe(fc)
+
+    with stages('astrometry'):
+        rotation = fx.site.rotation_at(fx.t)
+        sky = ZenithSky(fx.earth, fx.t, rotation[2], stardata, dsodata, constdata,
+                        centersdata, figures, starnames, fx.solar_system)
+
+    with stages('projection'):
+        layers = sky.layers(rotation)
+
+    chart = starmap.chart_template()
+    try:
+        starmap.render_chart(chart, layers, 'benchmark', os.path.join(output, 'starmap.png'),
+                             stage=stages)
+    finally:
+        chart.close()
+
+
+SCENARIOS = {
+    'small-field': lambda fx, stages, output: finder_charts(fx, stages, 1, output),
+    'all-sky': all_sky,
+    'batch': lambda fx, stages, output: finder_charts(fx, stages, FIXTURE_MESSIER, output),
+}
+
+
+def run(fx, scenario, repeat, output):
+    """Best-of-``repeat`` stage times plus one traced run for memory."""
+    best = {}
+    for _ in range(repeat):
+        stages = Stages()
+        SCENARIOS[scenario](fx, stages, output)
+        for name, stage in stages.results.items():
+            if name not in best or stage['seconds'] < best[name]['seconds']:
+                best[name] = stage
+
+    stages = Stages(trace_memory=True)
+    tracemalloc.start()
+    try:
+        SCENARIOS[scenario](fx, stages, output)
+    finally:
+        tracemalloc.stop()
+
+    for name, stage in best.items():
+        stage['peak_bytes'] = stages.results[name]['peak_bytes']
+        stage['allocated_blocks'] = stages.results[name]['allocated_blocks']
+    return {
+        'stages': best,
+        'total_seconds': sum(stage['seconds'] for stage in best.values()),
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':<12} {'stage':<12} {'seconds':>9} {'calls':>6} "
+          f"{'peak MiB':>9} {'blocks':>10}")
+    for scenario, result in results['scenarios'].items():
+        for name, stage in result['stages'].items():
+            print(f"{scenario:<12} {name:<12} {stage['seconds']:9.3f} {stage['calls']:6d} "
+                  f"{stage['peak_bytes'] / 2**20:9.1f} {stage['allocated_blocks']:10d}")
+        print(f"{scenario:<12} {'total':<12} {result['total_seconds']:9.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the chart pipeline per stage.')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per scenario (default: %(default)s)')
+    parser.add_argument('--output', default='bench_results.json',
+                        help='where to write the JSON results (default: %(default)s)')
+    args = parser.parse_args()
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error(f'unknown scenario {scenario!r}')
+    scenarios = args.scenarios or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory() as directory:
+        fx = Fixtures(directory)
+        results = {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'repeat': args.repeat,
+            'scenarios': {scenario: run(fx, scenario, args.repeat, directory)
+                          for scenario in scenarios},
+        }
+
+    print_results(results)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
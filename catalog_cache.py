@@ -0,0 +1,256 @@
+"""Local binary cache for the catalogs the charts are drawn from.
+
+The first run fetches and parses each catalog as before and writes it
+to a columnar store, one ``.npy`` file per column, under the cache
+directory (``$STARMAP_CACHE`` or ``~/.cache/starmap``).  Later runs
+memory-map those columns instead of going to the network and parsing
+text again.  The Stellarium DSO catalog goes through the same store,
+see ``dsos.load_catalog``.  Bump ``CACHE_VERSION`` whenever the stored
+layout changes.
+
+The star and DSO catalogs are stored sorted by magnitude, brightest
+first, so that a limiting magnitude is a prefix of the rows: see
+``brighter_than``.
+
+Every entry is a directory with a unique versioned name, and the entry
+name itself is a symbolic link to the current version.  Installing an
+entry swaps that link in one rename, so a reader, say a forked worker
+or a second script, always finds either the old entry or the new one.
+
+"""
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+CACHE_VERSION = 3
+
+STELLARIUM_URL = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
+                  '/skycultures/{culture}/{filename}')
+
+
+def cache_dir():
+    root = os.environ.get('STARMAP_CACHE',
+                          os.path.join(os.path.expanduser('~'), '.cache', 'starmap'))
+    return os.path.join(root, f'v{CACHE_VERSION}')
+
+
+def source_stamp(path):
+    if path is None:
+        return None
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _plain_array(values):
+    # Strings are stored as fixed-width unicode so they can be mapped.
+    values = values.to_numpy()
+    if values.dtype == object:
+        values = values.astype(str)
+    return values
+
+
+def save_columns(name, df, source=None):
+    """Write a dataframe to the cache as one ``.npy`` file per column."""
+    directory = os.path.join(cache_dir(), name)
+    tmp = f'{directory}.tmp-{os.getpid()}'
+    os.makedirs(tmp, exist_ok=True)
+
+    columns = list(df.columns)
+    for i, column in enumerate(columns):
+        np.save(os.path.join(tmp, f'{i}.npy'), _plain_array(df[column]))
+    np.save(os.path.join(tmp, 'index.npy'), _plain_array(df.index))
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({
+            'columns': columns,
+            'index': df.index.name,
+            'source': source_stamp(source),
+        }, f)
+
+    install_entry(tmp, name)
+
+
+def install_entry(tmp, name):
+    """Move the finished entry directory ``tmp`` into place as ``name``.
+
+    Writers fill a temporary directory next to the entry.  At the end it
+    is renamed to a new version and the link ``name`` is replaced by one
+    to that version, so that a crashed or concurrent writer never leaves
+    a half-written or missing entry behind.  The previous version is
+    removed afterwards.
+
+    """
+    root = cache_dir()
+    link = os.path.join(root, name)
+    version = f'{name}@{os.getpid()}-{time.time_ns()}'
+    pointer = f'{link}.link-{os.getpid()}'
+    old = os.path.realpath(link) if os.path.islink(link) else None
+    try:
+        os.replace(tmp, os.path.join(root, version))
+        os.symlink(version, pointer)
+        os.replace(pointer, link)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+        if os.path.lexists(pointer):
+            os.remove(pointer)
+        return
+    if old is not None:
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def entry_dir(name):
+    """Return the directory of the current version of the entry ``name``."""
+    return os.path.realpath(os.path.join(cache_dir(), name))
+
+
+def _read_meta(directory):
+    try:
+        with open(os.path.join(directory, 'meta.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_meta(name):
+    """Return the ``meta.json`` of the entry ``name``, or None if it is missing."""
+    return _read_meta(entry_dir(name))
+
+
+def load_arrays(name, source=None, mmap_mode='r'):
+    """Return the cached columns of ``name`` as memory-mapped arrays.
+
+    The result is a ``(columns, index, index_name)`` tuple, where
+    ``columns`` maps each column name to its array, or None if the entry
+    is missing.  Passing the ``source`` path the entry was built from
+    makes a stale entry (the file changed since) count as missing.
+    Nothing is read from disk until the arrays are indexed.
+
+    """
+    # The version is resolved once, so that all the columns come from
+    # the same one.  A writer removes the previous version right after
+    # swapping in the next, so a reader that lost that race resolves
+    # again.
+
+    for attempt in range(3):
+        directory = entry_dir(name)
+        meta = _read_meta(directory)
+        if meta is None:
+            if entry_dir(name) != directory:
+                continue
+            return None
+        if source is not None and meta['source'] != source_stamp(source):
+            return None
+        try:
+            index = np.load(os.path.join(directory, 'index.npy'), mmap_mode=mmap_mode)
+            columns = {
+                column: np.load(os.path.join(directory, f'{i}.npy'), mmap_mode=mmap_mode)
+                for i, column in enumerate(meta['columns'])
+            }
+        except FileNotFoundError:
+            continue
+        return columns, index, meta['index']
+    return None
+
+
+def load_columns(name, source=None, mmap_mode='r'):
+    """Return the cached dataframe ``name``, or None if it is missing."""
+    try:
+        from pandas import DataFrame, Index
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+
+    arrays = load_arrays(name, source, mmap_mode)
+    if arrays is None:
+        return None
+    columns, index, index_name = arrays
+    return DataFrame(columns, index=Index(index, name=index_name))
+
+
+def cached(name, build, source=None):
+    """Load ``name`` from the cache, calling ``build()`` to fill it first."""
+    df = load_columns(name, source)
+    if df is None:
+        save_columns(name, build(), source)
+        df = load_columns(name, source)
+    return df
+
+
+def sort_by_magnitude(df):
+    """Return the rows of ``df`` from bright to faint, those without a magnitude last."""
+    return df.iloc[np.argsort(df['magnitude'].to_numpy(), kind='stable')]
+
+
+def brighter_than(data, limiting_magnitude):
+    """Return how many leading rows of a magnitude-sorted catalog are within the limit.
+
+    ``data.iloc[:n]`` is then the part of the catalog to plot, as a
+    slice rather than a masked copy, and only that part needs
+    astrometry.
+
+    """
+    return int(np.searchsorted(data['magnitude'].to_numpy(), limiting_magnitude,
+                               side='right'))
+
+
+def load_hipparcos():
+    """Return the Hipparcos dataframe, as from ``hipparcos.load_dataframe``.
+
+    The rows are sorted by magnitude rather than by HIP number.
+
+    """
+    def build():
+        from skyfield.api import load
+        from skyfield.data import hipparcos
+        with load.open(hipparcos.URL) as f:
+            return sort_by_magnitude(hipparcos.load_dataframe(f))
+    return cached('hipparcos', build)
+
+
+def load_constellations(culture='western_SnT'):
+    """Return the constellation figures of a Stellarium sky culture.
+
+    The result has the same shape as ``stellarium.parse_constellations``:
+    a list of ``(name, [(star1, star2), ...])`` tuples.
+
+    """
+    def build():
+        from pandas import DataFrame
+        from skyfield.api import load
+        from skyfield.data import stellarium
+        url = STELLARIUM_URL.format(culture=culture, filename='constellationship.fab')
+        with load.open(url) as f:
+            consdata = stellarium.parse_constellations(f)
+        rows = [(name, star1, star2) for name, edges in consdata
+                for star1, star2 in edges]
+        return DataFrame(rows, columns=['name', 'star1', 'star2'])
+
+    df = cached(f'constellations-{culture}', build)
+    names = df['name'].to_numpy()
+    star1 = df['star1'].values.tolist()
+    star2 = df['star2'].values.tolist()
+
+    # The edges of each figure are stored contiguously, in file order.
+
+    starts = np.flatnonzero(np.append(True, names[1:] != names[:-1]))
+    stops = np.append(starts[1:], len(names))
+    return [(str(names[start]), list(zip(star1[start:stop], star2[start:stop])))
+            for start, stop in zip(starts, stops)]
+
+
+def load_star_names(culture='western_SnT'):
+    """Return ``(hip, name)`` pairs, as from ``stellarium.parse_star_names``."""
+    def build():
+        from pandas import DataFrame
+        from skyfield.api import load
+        from skyfield.data import stellarium
+        url = STELLARIUM_URL.format(culture=culture, filename='star_names.fab')
+        with load.open(url) as f:
+            star_names = stellarium.parse_star_names(f)
+        return DataFrame(star_names, columns=['hip', 'name'])
+
+    df = cached(f'star_names-{culture}', build)
+    return list(zip(df['hip'].values.tolist(), df['name'].to_numpy().tolist()))
@@ -0,0 +1,190 @@
+"""Export whole catalogs with derived columns, one chunk at a time.
+
+A ``CatalogExport`` cuts a catalog into chunks of ``chunk_size`` rows and
+derives the exported columns for each chunk with array operations: the
+constellation (see ``constellation_map``) and, when a site and time are
+given, the altitude, azimuth and the next rising and setting.  The
+chunks are written to JSON Lines, CSV or Parquet as they come, so only
+a few chunks are ever held in memory, and they can be computed by
+worker processes through ``render_batch``.
+
+"""
+import csv
+import json
+
+import numpy as np
+from skyfield.api import Star
+
+from batch_render import render_batch
+from constellation_map import ConstellationMap
+
+# Altitude of the center of a star at rising and setting, for the
+# standard atmospheric refraction at the horizon.
+
+HORIZON_DEGREES = -0.5667
+
+SIDEREAL_RATE = 1.00273790935
+
+
+class JsonLinesWriter:
+    def __init__(self, path):
+        self.f = open(path, 'w')
+
+    def write(self, columns):
+        names = list(columns)
+        rows = zip(*[np.asarray(columns[name]).tolist() for name in names])
+        self.f.writelines(json.dumps(dict(zip(names, row))) + "\n" for row in rows)
+
+    def close(self):
+        self.f.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.f = open(path, 'w', newline='')
+        self.writer = csv.writer(self.f)
+        self.header = False
+
+    def write(self, columns):
+        if not self.header:
+            self.writer.writerow(list(columns))
+            self.header = True
+        self.writer.writerows(zip(*[np.asarray(values).tolist()
+                                    for values in columns.values()]))
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as err:
+            raise ImportError("writing .parquet needs pyarrow") from err
+        self.pyarrow = pyarrow
+        self.path = path
+        self.writer = None
+
+    def write(self, columns):
+        table = self.pyarrow.table({name: np.asarray(values) for name, values in columns.items()})
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def open_writer(path):
+    """Return a chunk writer for ``path``, chosen by its extension."""
+    if path.endswith('.parquet'):
+        return ParquetWriter(path)
+    if path.endswith('.csv'):
+        return CsvWriter(path)
+    return JsonLinesWriter(path)
+
+
+# The export being written, for the forked workers of ``write``.
+
+_export = None
+
+
+def _export_chunk(k):
+    return _export.chunk(k)
+
+
+class CatalogExport:
+    """The exported columns of a catalog, derived chunk by chunk.
+
+    ``data`` needs the columns of ``Star.from_dataframe`` plus
+    ``magnitude`` and ``ra_degrees``, and ``names`` holds the exported
+    name of every row.  Pass ``observer``, a site's position at one time
+    (``(earth + site).at(t)``), together with the ``site`` to add
+    Altitude, Azimuth, Rise and Set.
+
+    """
+    def __init__(self, data, names, observer=None, site=None, chunk_size=10000):
+        self.data = data
+        self.names = np.asarray(names)
+        self.observer = observer
+        self.site = site
+        self.chunk_size = chunk_size
+        self.constellations = ConstellationMap()
+
+    def __len__(self):
+        return -(-len(self.data) // self.chunk_size)
+
+    def chunk(self, k):
+        """Return the exported columns of the ``k``-th chunk as a dict."""
+        rows = slice(k * self.chunk_size, (k + 1) * self.chunk_size)
+        data = self.data.iloc[rows]
+        abbreviation = self.constellations.abbreviation(data['ra_hours'].values,
+                                                        data['dec_degrees'].values)
+
+        # The catalogs are stored as float32, so round back to the
+        # precision of catalog.txt.
+
+        columns = {
+            "Name": self.names[rows],
+            "Constellation": self.constellations.describe(abbreviation),
+            "Magnitude": np.round(data["magnitude"].values.astype(float), 2),
+            "Right Ascention": np.round(data["ra_degrees"].values.astype(float), 5),
+            "Declination": np.round(data["dec_degrees"].values.astype(float), 5),
+        }
+        if self.observer is not None:
+            columns.update(self.horizon_columns(data))
+        return columns
+
+    def horizon_columns(self, data):
+        apparent = self.observer.observe(Star.from_dataframe(data)).apparent()
+        alt, az, distance = apparent.altaz()
+        ra, dec, distance = apparent.radec('date')
+        rise, setting = self.rise_set(ra.hours, dec.degrees)
+        return {
+            "Altitude": np.round(alt.degrees, 3),
+            "Azimuth": np.round(az.degrees, 3),
+            "Rise": rise,
+            "Set": setting,
+        }
+
+    def rise_set(self, ra_hours, dec_degrees):
+        """Return the next rising and setting, in UTC, for the observer's time.
+
+        The stars are taken to be fixed over the day, so the hour angle
+        at which each crosses the horizon follows from its declination.
+        Objects that never rise or never set get None.
+
+        """
+        t = self.observer.t
+        phi = np.radians(self.site.latitude.degrees)
+        dec = np.radians(dec_degrees)
+        with np.errstate(invalid='ignore'):
+            cos_h0 = ((np.sin(np.radians(HORIZON_DEGREES)) - np.sin(phi) * np.sin(dec))
+                      / (np.cos(phi) * np.cos(dec)))
+            h0 = np.degrees(np.arccos(cos_h0)) / 15.0
+
+        lst = t.gast + self.site.longitude.degrees / 15.0
+        times = []
+        for hour_angle in (-h0, h0):
+            hours = (ra_hours + hour_angle - lst) % 24.0 / SIDEREAL_RATE
+            crosses = np.isfinite(hours)
+            utc = np.array(t.ts.tt_jd(t.tt + np.where(crosses, hours, 0.0) / 24.0).utc_iso(),
+                           dtype=object).reshape(-1)
+            utc[~crosses] = None
+            times.append(utc)
+        return times
+
+    def write(self, path, processes=1):
+        """Write every chunk to ``path``, computing them in ``processes`` workers."""
+        global _export
+        writer = open_writer(path)
+        _export = self
+        try:
+            for columns in render_batch(_export_chunk, range(len(self)), processes):
+                writer.write(columns)
+        finally:
+            _export = None
+            writer.close()
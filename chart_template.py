@@ -0,0 +1,81 @@
+import numpy as np
+from matplotlib import pyplot as plt
+from matplotlib.collections import LineCollection
+
+from starmap_utils import add_telrad_circles
+
+
+class ChartTemplate:
+    """A figure whose static artists are built once and reused per chart.
+
+    Telrad rings, the horizon disk, limits and styling are added when the
+    template is set up.  The layers that change from chart to chart
+    (stars, lines, labels) are created empty and every chart only
+    updates their offsets, sizes, segments or text before saving.
+
+    Pass ``ax`` to set up a chart on one of the axes of an existing
+    figure, for example a sheet holding several charts.
+
+    """
+    def __init__(self, limit, figsize=None, dpi=100, ax=None):
+        if ax is None:
+            self.fig, self.ax = plt.subplots(figsize=figsize, dpi=dpi)
+        else:
+            self.fig, self.ax = ax.figure, ax
+        self.limit = limit
+        self.layers = {}
+
+        ax = self.ax
+        ax.set_xlim(-limit, limit)
+        ax.set_ylim(-limit, limit)
+        ax.xaxis.set_visible(False)
+        ax.yaxis.set_visible(False)
+        ax.set_aspect(1.0)
+        ax.axis('off')
+
+    def add_telrad_circles(self, fgcolor, bgcolor):
+        add_telrad_circles(self.ax, fgcolor, bgcolor)
+
+    def add_horizon(self, color='navy'):
+        """Fill the horizon disk and clip every collection to it."""
+        self.ax.add_patch(plt.Circle((0, 0), 1, color=color, zorder=-2, fill=True))
+        self.horizon = plt.Circle((0, 0), radius=1, transform=self.ax.transData)
+
+    def add_lines(self, name, **style):
+        lines = LineCollection([], **style)
+        self.ax.add_collection(lines)
+        self._add_layer(name, lines)
+
+    def add_scatter(self, name, **style):
+        empty = np.empty(0)
+        self._add_layer(name, self.ax.scatter(empty, empty, **style))
+
+    def add_text(self, name, x, y, **style):
+        self.layers[name] = self.ax.text(x, y, '', **style)
+
+    def add_title(self, name='title', **style):
+        """Add the axes title as a text layer, empty until ``set_text``."""
+        self.layers[name] = self.ax.set_title('', **style)
+
+    def _add_layer(self, name, collection):
+        if getattr(self, 'horizon', None) is not None:
+            collection.set_clip_path(self.horizon)
+        self.layers[name] = collection
+
+    def set_lines(self, name, segments):
+        self.layers[name].set_segments(segments)
+
+    def set_scatter(self, name, xy, sizes=None):
+        layer = self.layers[name]
+        layer.set_offsets(np.asarray(xy).reshape(-1, 2))
+        if sizes is not None:
+            layer.set_sizes(np.atleast_1d(sizes))
+
+    def set_text(self, name, text):
+        self.layers[name].set_text(text)
+
+    def save(self, filename, **kwargs):
+        self.fig.savefig(filename, **kwargs)
+
+    def close(self):
+        plt.close(self.fig)
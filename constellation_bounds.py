@@ -1,5 +1,9 @@
+import numpy as np
 from skyfield.constants import T0
 
+import catalog_cache
+from constellation_map import b1875_rotation
+
 _COLUMN_NAMES = (
     'RAhrs', 'DEdeg', 'Segment',
 )
@@ -35,4 +39,129 @@ def load_dataframe(fobj):
         ra_degrees = df['ra_hours'] / 15.0,
         epoch_year = 2000.0,
     )
-    return df.set_index('segment')
\ No newline at end of file
+    return df.set_index('segment')
+
+
+def border_pairs(constdata):
+    """Return the positions of the first and second point of each border line."""
+    order = np.argsort(constdata.index.values, kind='stable')
+    segment = constdata.index.values[order]
+    same_segment = segment[1:] == segment[:-1]
+    return order[:-1][same_segment], order[1:][same_segment]
+
+
+def _sexagesimal(values):
+    """Turn ``[+-]dd:mm:ss`` strings into signed decimal numbers."""
+    values = np.asarray(values)
+    sign = np.where(np.char.startswith(values, '-'), -1.0, 1.0)
+    parts = np.char.split(np.char.lstrip(values, '+-'), ':')
+    d, m, sec = np.array(parts.tolist(), dtype=float).T
+    return sign * (d + m / 60.0 + sec / 3600.0)
+
+
+def parse_edges(fobj):
+    """Return the edges of `edges_18.txt` as a dict of arrays.
+
+    The keys are ``vertex1`` and ``vertex2``, ``meridian`` and
+    ``increasing`` (the edge type and direction), the B1875
+    ``ra_hours1``, ``dec_degrees1``, ``ra_hours2`` and ``dec_degrees2``,
+    and the two constellations the edge separates, ``constellation1``
+    and ``constellation2``.  An edge that is listed twice, in either
+    direction, is kept once.
+
+    """
+    rows = np.array([line.split() for line in fobj if line.strip()])
+    vertices = np.char.split(rows[:, 0], ':').tolist()
+    vertex1, vertex2 = np.array(vertices).T
+    pair = np.where((vertex1 < vertex2)[:, None],
+                    np.column_stack([vertex1, vertex2]), np.column_stack([vertex2, vertex1]))
+    unique = np.sort(np.unique(pair, axis=0, return_index=True)[1])
+    rows = rows[unique]
+    return {
+        'vertex1': vertex1[unique],
+        'vertex2': vertex2[unique],
+        'meridian': np.char.startswith(rows[:, 1], 'M'),
+        'increasing': np.char.endswith(rows[:, 1], '+'),
+        'ra_hours1': _sexagesimal(rows[:, 2]),
+        'dec_degrees1': _sexagesimal(rows[:, 3]),
+        'ra_hours2': _sexagesimal(rows[:, 4]),
+        'dec_degrees2': _sexagesimal(rows[:, 5]),
+        'constellation1': rows[:, 6],
+        'constellation2': rows[:, 7],
+    }
+
+
+def densify(edges, step_degrees=1.0):
+    """Return ``(edge, ra_hours, dec_degrees)`` of points along the edges.
+
+    The boundaries run along B1875 meridians and parallels, so the
+    meridian edges keep their RA and the parallel edges their
+    declination.  Every edge gets both of its vertices and enough
+    points in between that neighbours are at most ``step_degrees``
+    apart.
+
+    """
+    ra1 = edges['ra_hours1']
+    dec1 = edges['dec_degrees1']
+    dec_step = edges['dec_degrees2'] - dec1
+
+    # Parallels run in the direction of the edge, across 0h if need be.
+
+    ra_step = np.where(edges['increasing'], (edges['ra_hours2'] - ra1) % 24.0,
+                       -((ra1 - edges['ra_hours2']) % 24.0))
+    ra_step[edges['meridian']] = 0.0
+    length = np.where(edges['meridian'], np.abs(dec_step),
+                      np.abs(ra_step) * 15.0 * np.cos(np.radians(dec1)))
+    steps = np.maximum(np.ceil(length / step_degrees), 1).astype(int)
+
+    edge = np.repeat(np.arange(len(steps)), steps + 1)
+    starts = np.append(0, np.cumsum(steps + 1)[:-1])
+    fraction = (np.arange(len(edge)) - starts[edge]) / steps[edge]
+    ra = (ra1[edge] + fraction * ra_step[edge]) % 24.0
+    dec = dec1[edge] + fraction * dec_step[edge]
+    return edge, ra, dec
+
+
+def compile_boundaries(fobj, step_degrees=1.0):
+    """Return the boundaries of `edges_18.txt` as J2000 points along every edge.
+
+    The result has the shape of ``load_dataframe``, one row per point
+    and indexed by edge, plus the two constellations each edge
+    separates, so every shared edge appears once.
+
+    """
+    try:
+        from pandas import DataFrame, Index
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+
+    edges = parse_edges(fobj)
+    edge, ra, dec = densify(edges, step_degrees)
+
+    ra = np.radians(ra * 15.0)
+    dec = np.radians(dec)
+    x, y, z = b1875_rotation().T @ np.array([np.cos(dec) * np.cos(ra),
+                                              np.cos(dec) * np.sin(ra),
+                                              np.sin(dec)])
+    ra_degrees = np.degrees(np.arctan2(y, x)) % 360.0
+    return DataFrame({
+        'ra_hours': ra_degrees / 15.0,
+        'dec_degrees': np.degrees(np.arctan2(z, np.hypot(x, y))),
+        'ra_degrees': ra_degrees,
+        'epoch_year': 2000.0,
+        'constellation1': edges['constellation1'][edge],
+        'constellation2': edges['constellation2'][edge],
+    }, index=Index(edge, name='segment'))
+
+
+def load_boundaries(path='data/edges_18.txt', step_degrees=1.0):
+    """Return the compiled boundaries of ``path``, see ``compile_boundaries``.
+
+    They are compiled once and then memory-mapped from ``catalog_cache``,
+    until `edges_18.txt` changes.
+
+    """
+    def build():
+        with open(path) as f:
+            return compile_boundaries(f, step_degrees)
+    return catalog_cache.cached(f'boundaries-{step_degrees:g}', build, source=path)
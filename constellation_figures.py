@@ -0,0 +1,82 @@
+"""Constellation stick figures compiled against a star catalog.
+
+A figure is stored as the positional indices of the two stars of every
+edge into the rows of the catalog, with the edges of each constellation
+kept contiguous and located by an offsets array.  Once compiled, the
+line segments of any projection are a single ``np.take`` of the
+projected coordinates, instead of looking the Hipparcos numbers up in
+the 118k-row dataframe for every chart.
+
+"""
+import numpy as np
+
+import catalog_cache
+
+
+class ConstellationFigures:
+    """The figures of a sky culture as integer indices into ``stardata``.
+
+    The edges of the k-th constellation are ``star1[offsets[k]:offsets[k+1]]``
+    and ``star2[offsets[k]:offsets[k+1]]``.  Edges whose stars are not in
+    the catalog are left out.
+
+    """
+    def __init__(self, consdata, stardata):
+        self.index = stardata.index
+        hips1 = [star1 for name, edges in consdata for star1, star2 in edges]
+        hips2 = [star2 for name, edges in consdata for star1, star2 in edges]
+        counts = [len(edges) for name, edges in consdata]
+
+        star1 = self.index.get_indexer(hips1)
+        star2 = self.index.get_indexer(hips2)
+        known = (star1 >= 0) & (star2 >= 0)
+        figure = np.repeat(np.arange(len(counts)), counts)
+
+        self.names = [name for name, edges in consdata]
+        self.star1 = star1[known]
+        self.star2 = star2[known]
+        self.offsets = np.searchsorted(figure[known], np.arange(len(counts) + 1))
+
+        # Every star that appears in a figure, as sorted positions.
+
+        self.stars = np.union1d(self.star1, self.star2)
+
+    def __len__(self):
+        return len(self.names)
+
+    def edges(self, name):
+        """Return the slice of the edges of the constellation ``name``."""
+        k = self.names.index(name)
+        return slice(self.offsets[k], self.offsets[k + 1])
+
+    def segments(self, x, y, edges=slice(None)):
+        """Return the (edges, 2, 2) line segments for the star coordinates.
+
+        ``x`` and ``y`` are arrays over the rows of the catalog the
+        figures were compiled against, for example a projection.
+
+        """
+        xy = np.column_stack([x, y])
+        return np.stack([np.take(xy, self.star1[edges], axis=0),
+                         np.take(xy, self.star2[edges], axis=0)], axis=1)
+
+
+# Compiled figures by sky culture and catalog, so that several cultures
+# can be kept side by side in one process.
+
+_compiled = {}
+
+
+def load(culture, stardata):
+    """Return the compiled figures of ``culture`` for ``stardata``.
+
+    The figures are compiled the first time and reused as long as the
+    catalog keeps the same index.
+
+    """
+    key = (culture, id(stardata.index))
+    figures = _compiled.get(key)
+    if figures is None or figures.index is not stardata.index:
+        figures = ConstellationFigures(catalog_cache.load_constellations(culture), stardata)
+        _compiled[key] = figures
+    return figures
@@ -0,0 +1,64 @@
+"""Which constellation whole arrays of positions fall in.
+
+Skyfield's ``load_constellation_map`` looks positions up in a grid of
+the IAU boundaries, which are drawn along the B1875 equator.  Here the
+same grid, ``constellations.npz``, is used for plain RA/Dec arrays: the
+J2000 coordinates are turned into unit vectors, precessed to B1875 with
+one matrix product and located with ``searchsorted``, without building
+a skyfield position per object.
+
+"""
+import numpy as np
+from skyfield.api import load, load_constellation_names
+from skyfield.functions import load_bundled_npy
+from skyfield.timelib import julian_date_of_besselian_epoch
+
+
+def b1875_rotation():
+    """Return the matrix that turns J2000 vectors into B1875 ones.
+
+    It is the same rotation as ``position.radec(epoch=t1875)``; its
+    transpose takes B1875 vectors back to J2000.
+
+    """
+    ts = load.timescale()
+    return ts.tt_jd(julian_date_of_besselian_epoch(1875)).M
+
+
+class ConstellationMap:
+    """Look up the constellations of catalogs of J2000 coordinates."""
+
+    def __init__(self):
+        arrays = load_bundled_npy('constellations.npz')
+        self.sorted_ra = arrays['sorted_ra']
+        self.sorted_dec = arrays['sorted_dec']
+        self.radec_to_index = arrays['radec_to_index']
+        self.abbreviations = arrays['indexed_abbreviations']
+        self.names = dict(load_constellation_names())
+
+        self.to_b1875 = b1875_rotation()
+
+    def b1875(self, ra_hours, dec_degrees):
+        """Precess J2000 RA (hours) and Dec (degrees) to B1875."""
+        ra = np.radians(np.asarray(ra_hours, dtype=float) * 15.0)
+        dec = np.radians(np.asarray(dec_degrees, dtype=float))
+        x, y, z = self.to_b1875 @ np.array([np.cos(dec) * np.cos(ra),
+                                            np.cos(dec) * np.sin(ra),
+                                            np.sin(dec)])
+        ra_hours = np.degrees(np.arctan2(y, x)) / 15.0 % 24.0
+        dec_degrees = np.degrees(np.arctan2(z, np.hypot(x, y)))
+        return ra_hours, dec_degrees
+
+    def abbreviation(self, ra_hours, dec_degrees):
+        """Return the constellation abbreviations for J2000 RA/Dec arrays."""
+        ra, dec = self.b1875(ra_hours, dec_degrees)
+        i = np.searchsorted(self.sorted_ra, ra)
+        j = np.searchsorted(self.sorted_dec, dec, side='right')
+        return self.abbreviations[self.radec_to_index[i, j]]
+
+    def describe(self, abbreviations):
+        """Return ``"Name (Abr)"`` strings for an array of abbreviations."""
+        unique, inverse = np.unique(abbreviations, return_inverse=True)
+        labels = np.array([f"{self.names.get(abrv)} ({abrv})" for abrv in unique],
+                          dtype=object)
+        return labels[inverse]
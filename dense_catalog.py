@@ -0,0 +1,288 @@
+"""Dense star catalogs, Tycho-2 or a Gaia extract, streamed from disk.
+
+Hipparcos fits in memory many times over, but Tycho-2 has 2.5 million
+stars and a magnitude-limited Gaia extract tens of millions.  Such a
+catalog is converted once into the column store of ``catalog_cache``,
+bucketed into declination zones and sorted by magnitude inside every
+zone.  A query only touches the zones its cone reaches, stops every
+zone at the limiting magnitude with ``searchsorted`` and tests what is
+left against the cone ``chunk_size`` rows at a time, so that only the
+visible stars are ever built into a dataframe and observed.
+
+Convert a catalog with::
+
+    python dense_catalog.py --format tycho2 tyc2.dat.00.gz tyc2.dat.01.gz ...
+    python dense_catalog.py --format gaia --name gaia-g12 gaia_extract.csv
+
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+import catalog_cache
+from projection_engine import center_vector
+
+ZONE_DEGREES = 1.0
+
+# The stored columns and their types.  ``ra_hours`` is derived when a
+# dataframe is built.
+
+COLUMNS = [
+    ('magnitude', np.float32),
+    ('ra_degrees', np.float64),
+    ('dec_degrees', np.float64),
+    ('parallax_mas', np.float32),
+    ('ra_mas_per_year', np.float32),
+    ('dec_mas_per_year', np.float32),
+    ('epoch_year', np.float32),
+]
+
+
+def zone_of(dec_degrees, zone_degrees=ZONE_DEGREES):
+    count = int(round(180.0 / zone_degrees))
+    zone = np.floor((np.asarray(dec_degrees) + 90.0) / zone_degrees).astype(int)
+    return np.clip(zone, 0, count - 1)
+
+
+def read_tycho2(paths, chunk_size=200000):
+    """Yield the stars of the Tycho-2 ``catalog.dat`` files in chunks.
+
+    The mean positions are ICRS at epoch J2000.  The few stars without
+    one (``pflag`` X) get their observed position at its own epoch and
+    no proper motion.  The magnitude is Johnson V from BT and VT.
+
+    """
+    try:
+        from pandas import read_csv
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+
+    usecols = [0, 2, 3, 4, 5, 17, 19, 24, 25, 26]
+    names = ['tyc', 'ra_mean', 'dec_mean', 'pm_ra', 'pm_dec', 'bt', 'vt',
+             'ra_observed', 'dec_observed', 'epoch_observed']
+    for path in paths:
+        for df in read_csv(path, sep='|', header=None, usecols=usecols, names=names,
+                           dtype={'tyc': str}, skipinitialspace=True,
+                           chunksize=chunk_size):
+            tyc = df['tyc'].str.split(expand=True).astype(int)
+            mean = df['ra_mean'].notna().values
+            vt = df['vt'].values
+            bt = df['bt'].values
+            magnitude = np.where(np.isnan(bt), vt, vt - 0.090 * (bt - vt))
+            magnitude = np.where(np.isnan(vt), bt, magnitude)
+            yield df.assign(
+                magnitude=magnitude,
+                ra_degrees=np.where(mean, df['ra_mean'], df['ra_observed']),
+                dec_degrees=np.where(mean, df['dec_mean'], df['dec_observed']),
+                parallax_mas=0.0,
+                ra_mas_per_year=df['pm_ra'].fillna(0.0),
+                dec_mas_per_year=df['pm_dec'].fillna(0.0),
+                epoch_year=np.where(mean, 2000.0, 1990.0 + df['epoch_observed'].values),
+            ).set_index(tyc[0].astype(str) + '-' + tyc[1].astype(str) + '-'
+                        + tyc[2].astype(str)).rename_axis('tyc')[[c for c, dtype in COLUMNS]]
+
+
+def read_gaia(paths, chunk_size=200000):
+    """Yield the stars of Gaia DR3 CSV extracts in chunks.
+
+    The files need the archive columns ``source_id``, ``ra``, ``dec``,
+    ``parallax``, ``pmra``, ``pmdec`` and ``phot_g_mean_mag``.  The
+    positions are at epoch 2016.0 and the magnitude is Gaia G, not V.
+
+    """
+    try:
+        from pandas import read_csv
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+
+    names = {
+        'source_id': 'source_id',
+        'phot_g_mean_mag': 'magnitude',
+        'ra': 'ra_degrees',
+        'dec': 'dec_degrees',
+        'parallax': 'parallax_mas',
+        'pmra': 'ra_mas_per_year',
+        'pmdec': 'dec_mas_per_year',
+    }
+    for path in paths:
+        for df in read_csv(path, usecols=list(names), chunksize=chunk_size):
+            df = df.rename(columns=names).set_index('source_id')
+            yield df.fillna({'parallax_mas': 0.0, 'ra_mas_per_year': 0.0,
+                             'dec_mas_per_year': 0.0}).assign(epoch_year=2016.0)
+
+
+READERS = {'tycho2': read_tycho2, 'gaia': read_gaia}
+
+
+def convert(name, read_chunks, zone_degrees=ZONE_DEGREES):
+    """Write a dense catalog to the cache entry ``name``.
+
+    ``read_chunks()`` returns an iterator over dataframes holding the
+    ``COLUMNS`` with the star ids as index.  It is called twice, once to
+    count the stars of every zone and once to copy them into place, so
+    that no more than a chunk of the source is in memory at a time.
+
+    """
+    zone_count = int(round(180.0 / zone_degrees))
+    counts = np.zeros(zone_count, dtype=int)
+    index_dtype = None
+    index_name = None
+    for df in read_chunks():
+        counts += np.bincount(zone_of(df['dec_degrees'].values, zone_degrees),
+                              minlength=zone_count)
+        index = df.index.to_numpy()
+        if index.dtype == object:
+            index = index.astype(str)
+        index_dtype = index.dtype if index_dtype is None else np.promote_types(index_dtype,
+                                                                               index.dtype)
+        index_name = df.index.name
+
+    offsets = np.append(0, np.cumsum(counts))
+    total = int(offsets[-1])
+    directory = os.path.join(catalog_cache.cache_dir(), name)
+    tmp = f'{directory}.tmp-{os.getpid()}'
+    os.makedirs(tmp, exist_ok=True)
+
+    open_memmap = np.lib.format.open_memmap
+    columns = [open_memmap(os.path.join(tmp, f'{i}.npy'), mode='w+', dtype=dtype,
+                           shape=(total,))
+               for i, (column, dtype) in enumerate(COLUMNS)]
+    columns.append(open_memmap(os.path.join(tmp, 'index.npy'), mode='w+',
+                               dtype=index_dtype, shape=(total,)))
+
+    # Copy every chunk zone by zone behind the stars already written.
+
+    cursor = offsets[:-1].copy()
+    for df in read_chunks():
+        zone = zone_of(df['dec_degrees'].values, zone_degrees)
+        order = np.argsort(zone, kind='stable')
+        bounds = np.searchsorted(zone[order], np.arange(zone_count + 1))
+        values = [df[column].to_numpy()[order] for column, dtype in COLUMNS]
+        values.append(df.index.to_numpy()[order])
+        for z in np.flatnonzero(np.diff(bounds)):
+            rows = slice(bounds[z], bounds[z + 1])
+            dest = slice(cursor[z], cursor[z] + bounds[z + 1] - bounds[z])
+            for column, v in zip(columns, values):
+                column[dest] = v[rows]
+            cursor[z] = dest.stop
+
+    # Then sort every zone by magnitude, stars without one last.
+
+    for start, stop in zip(offsets[:-1], offsets[1:]):
+        order = np.argsort(columns[0][start:stop], kind='stable')
+        for column in columns:
+            column[start:stop] = column[start:stop][order]
+
+    for column in columns:
+        column.flush()
+    del columns
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({
+            'columns': [column for column, dtype in COLUMNS],
+            'index': index_name,
+            'source': None,
+            'zone_degrees': zone_degrees,
+            'zone_offsets': offsets.tolist(),
+        }, f)
+    catalog_cache.install_entry(tmp, name)
+
+
+class DenseCatalog:
+    """Cone and magnitude queries streamed over a converted dense catalog.
+
+    ``query`` returns sorted positions into the stored rows, like
+    ``SkyIndex.query``, and ``cone`` the matching stars as a dataframe
+    in the shape of ``hipparcos.load_dataframe``, ready for
+    ``Star.from_dataframe``.
+
+    """
+    def __init__(self, name, chunk_size=100000):
+        arrays = catalog_cache.load_arrays(name)
+        if arrays is None:
+            raise FileNotFoundError(f'no dense catalog {name!r} in {catalog_cache.cache_dir()},'
+                                    ' convert it with dense_catalog.py first')
+        self.columns, self.index, self.index_name = arrays
+        meta = catalog_cache.load_meta(name)
+        self.zone_degrees = meta['zone_degrees']
+        self.offsets = np.array(meta['zone_offsets'])
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.index)
+
+    def query(self, center, radius_degrees, limiting_magnitude=None):
+        """Return the positions of the stars in a cone around ``center``.
+
+        ``center`` is a skyfield position or a 3-vector.  A radius of
+        180 degrees or more selects the whole sky and only filters on
+        magnitude.
+
+        """
+        radius = np.radians(radius_degrees)
+        zones = range(len(self.offsets) - 1)
+        whole_sky = center is None or radius >= np.pi
+        if not whole_sky:
+            c = center_vector(center)
+            cos_radius = np.cos(radius)
+            center_dec = np.degrees(np.arcsin(np.clip(c[2], -1.0, 1.0)))
+            first, last = zone_of([center_dec - radius_degrees, center_dec + radius_degrees],
+                                  self.zone_degrees)
+            zones = range(first, last + 1)
+
+        magnitude = self.columns['magnitude']
+        ra_degrees = self.columns['ra_degrees']
+        dec_degrees = self.columns['dec_degrees']
+        found = []
+        for z in zones:
+            start, stop = self.offsets[z], self.offsets[z + 1]
+            if limiting_magnitude is not None:
+                stop = start + np.searchsorted(magnitude[start:stop], limiting_magnitude,
+                                               side='right')
+            if whole_sky:
+                found.append(np.arange(start, stop))
+                continue
+            for a in range(start, stop, self.chunk_size):
+                b = min(a + self.chunk_size, stop)
+                ra = np.radians(ra_degrees[a:b])
+                dec = np.radians(dec_degrees[a:b])
+                cos_dec = np.cos(dec)
+                inside = (c[0] * cos_dec * np.cos(ra) + c[1] * cos_dec * np.sin(ra)
+                          + c[2] * np.sin(dec)) >= cos_radius
+                found.append(a + np.flatnonzero(inside))
+
+        if not found:
+            return np.empty(0, dtype=int)
+        return np.concatenate(found)
+
+    def dataframe(self, rows):
+        """Return the stars at the positions ``rows`` as a dataframe."""
+        try:
+            from pandas import DataFrame, Index
+        except ImportError:
+            raise ImportError("NO PANDAS NO CANDO")
+
+        df = DataFrame({column: values[rows].astype(float)
+                        for column, values in self.columns.items()},
+                       index=Index(self.index[rows], name=self.index_name))
+        return df.assign(ra_hours=df['ra_degrees'] / 15.0)
+
+    def cone(self, center, radius_degrees, limiting_magnitude=None):
+        """Return the stars of ``query`` as a dataframe."""
+        return self.dataframe(self.query(center, radius_degrees, limiting_magnitude))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert a dense star catalog for streaming.')
+    parser.add_argument('paths', nargs='+', help='catalog files, optionally gzipped')
+    parser.add_argument('--format', choices=sorted(READERS), default='tycho2')
+    parser.add_argument('--name', help='cache entry to write (default: the format)')
+    parser.add_argument('--chunk-size', type=int, default=200000)
+    args = parser.parse_args()
+
+    reader = READERS[args.format]
+    name = args.name or args.format
+    convert(name, lambda: reader(args.paths, args.chunk_size))
+    print(f'{len(DenseCatalog(name))} stars in {os.path.join(catalog_cache.cache_dir(), name)}')
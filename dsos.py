@@ -1,5 +1,8 @@
+import numpy as np
 from skyfield.constants import T0
 
+import catalog_cache
+
 _COLUMN_NAMES = (
     'DSOID', 'RAdeg', 'DEdeg', 'Bmag', 'Vmag',
     'OType', 'MType', 'MajRarcmin', 'MinRarcmin', 'OAdegrees', 'RS', 'RSerror',
@@ -42,4 +45,96 @@ def load_dataframe(fobj):
     )
     df.loc[df['messier_id'] != 0.0, 'label'] = 'M' + df['messier_id'].astype(str)
     df = df[~df.messier_id.eq(0.0)]
-    return df.set_index('dso_id')
\ No newline at end of file
+    return df.set_index('dso_id')
+
+# Compact typed layout used by ``load_catalog``: float32 coordinates and
+# magnitudes, integer cross-identifications (0 when there is none).
+
+_BINARY_COLUMNS = (
+    ('DSOID', 'dso_id', 'i4'),
+    ('RAdeg', 'ra_degrees', 'f4'),
+    ('DEdeg', 'dec_degrees', 'f4'),
+    ('Bmag', 'magnitudeB', 'f4'),
+    ('Vmag', 'magnitude', 'f4'),
+    ('NGC', 'ngc_id', 'i4'),
+    ('IC', 'ic_id', 'i4'),
+    ('M', 'messier_id', 'i4'),
+)
+
+_CATALOG_COLUMNS = {'M': 'messier_id', 'NGC': 'ngc_id', 'IC': 'ic_id'}
+
+
+def convert_catalog(fobj):
+    """Parse `catalog.txt` into the compact dataframe stored by the cache."""
+    try:
+        from pandas import read_csv
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+
+    fobj.seek(0)
+    magic = fobj.read(2)
+    compression = 'gzip' if (magic == b'\x1f\x8b') else None
+    fobj.seek(0)
+
+    df = read_csv(
+        fobj, sep='	', names=_COLUMN_NAMES, compression=compression,
+        comment='#',
+        usecols=[source for source, name, dtype in _BINARY_COLUMNS],
+        na_values=[''],
+    )
+    for source, name, dtype in _BINARY_COLUMNS:
+        if dtype.startswith('i'):
+            df[source] = df[source].fillna(0)
+        df[source] = df[source].astype(dtype)
+    df.columns = [name for source, name, dtype in _BINARY_COLUMNS]
+    return catalog_cache.sort_by_magnitude(df.set_index('dso_id'))
+
+
+def load_catalog(path='data/catalog.txt', catalogs=('M',), limiting_magnitude=None):
+    """Return the DSOs of `catalog.txt` in the shape of ``load_dataframe``.
+
+    The first call converts the file to the compact typed layout of
+    ``catalog_cache``, sorted by magnitude; later calls memory-map it.
+    The filters are applied to the mapped columns before any dataframe
+    is built: ``limiting_magnitude`` keeps only the leading rows up to
+    the limit, dropping the fainter objects and those without a
+    magnitude, and ``catalogs`` keeps the objects with an id in any of
+    'M', 'NGC' and 'IC' (None keeps everything).  The result stays in
+    magnitude order.
+
+    """
+    try:
+        from pandas import DataFrame, Index
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+    arrays = catalog_cache.load_arrays('dso_catalog', source=path)
+    if arrays is None:
+        with open(path, 'rb') as f:
+            catalog_cache.save_columns('dso_catalog', convert_catalog(f), source=path)
+        arrays = catalog_cache.load_arrays('dso_catalog', source=path)
+    columns, index, index_name = arrays
+
+    stop = len(index)
+    if limiting_magnitude is not None:
+        stop = int(np.searchsorted(columns['magnitude'], limiting_magnitude, side='right'))
+    rows = slice(0, stop)
+    if catalogs is not None:
+        keep = np.zeros(stop, dtype=bool)
+        for catalog in catalogs:
+            keep |= columns[_CATALOG_COLUMNS[catalog]][:stop] != 0
+        rows = np.flatnonzero(keep)
+
+    df = DataFrame({name: values[rows] for name, values in columns.items()},
+                   index=Index(index[rows], name=index_name))
+    df = df.assign(
+        ra_hours = df['ra_degrees'] / 15.0,
+        epoch_year = 2000.0,
+    )
+
+    # Label each object by the first catalog it appears in.
+
+    label = df.index.astype(str).values
+    for prefix, column in (('IC ', 'ic_id'), ('NGC ', 'ngc_id'), ('M', 'messier_id')):
+        ids = df[column].values
+        label = np.where(ids != 0, prefix + ids.astype(str).astype(object), label)
+    return df.assign(label=label)
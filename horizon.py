@@ -0,0 +1,73 @@
+"""Altitude and azimuth of whole catalogs for one site and time.
+
+Skyfield finds the altitude of a position through
+``apparent().altaz()``, building the position first.  Here the unit
+vectors a chart already has (see ``ProjectionEngine``) are turned into
+the horizon frame of the site with the single matrix of
+``rotation_at``, so every object of every layer gets its altitude in
+one pass.  The vectors are astrometric, which leaves them within the
+aberration, some 20 arcseconds, of the apparent positions: plenty to
+decide what is above the horizon.
+
+"""
+import numpy as np
+from skyfield.earthlib import refract as _refract
+
+# Extinction in magnitudes per airmass in V, for a fair site.
+
+EXTINCTION_COEFFICIENT = 0.2
+
+
+def altaz(site, t, unit):
+    """Return the altitude and azimuth, in degrees, of (3, N) unit vectors.
+
+    ``site`` is a ``wgs84.latlon`` position and ``t`` a single time.
+    The azimuth counts from north through east.
+
+    """
+    return rotated_altaz(site.rotation_at(t), unit)
+
+
+def rotated_altaz(rotation, unit):
+    """Like ``altaz`` with the matrix of ``site.rotation_at(t)`` given.
+
+    Sites that share an epoch share the unit vectors too, so a batch of
+    sites only needs one matrix per site, see ``site_batch``.
+
+    """
+    x, y, z = np.tensordot(rotation, unit, axes=1)
+    alt = np.degrees(np.arcsin(np.clip(z, -1.0, 1.0)))
+    az = np.degrees(np.arctan2(y, x)) % 360.0
+    return alt, az
+
+
+def refract(alt_degrees, temperature_C=10.0, pressure_mbar=1010.0):
+    """Return the altitudes at which the atmosphere shows the objects."""
+    return _refract(np.asarray(alt_degrees, dtype=float), temperature_C, pressure_mbar)
+
+
+def zenith_refraction(x, y, alt_degrees, temperature_C=10.0, pressure_mbar=1010.0):
+    """Refract the stereographic *x* and *y* of a chart centered on the zenith.
+
+    On such a chart an object at altitude ``alt`` lies ``tan((90 - alt) / 2)``
+    from the center, so every object is moved along its radius to the
+    altitude at which it is seen.  Returns ``(x, y, refracted_alt)``.
+
+    """
+    seen = refract(alt_degrees, temperature_C, pressure_mbar)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scale = (np.tan(np.radians(90.0 - seen) / 2.0)
+                 / np.tan(np.radians(90.0 - np.asarray(alt_degrees)) / 2.0))
+    scale = np.where(np.isfinite(scale), scale, 1.0)
+    return x * scale, y * scale, seen
+
+
+def airmass(alt_degrees):
+    """The Kasten and Young (1989) airmass, 1 at the zenith."""
+    h = np.clip(alt_degrees, 0.0, 90.0)
+    return 1.0 / (np.sin(np.radians(h)) + 0.50572 * (h + 6.07995) ** -1.6364)
+
+
+def extinction(alt_degrees, coefficient=EXTINCTION_COEFFICIENT):
+    """Return how many magnitudes fainter than at the zenith objects appear."""
+    return coefficient * (airmass(alt_degrees) - 1.0)
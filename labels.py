@@ -0,0 +1,153 @@
+"""Label placement for the charts.
+
+Candidates are picked with vectorized masks, the ones that would overlap
+a more important label are dropped using a coarse grid over the chart,
+and only the survivors become artists.
+
+The survivors are drawn as a single ``PathCollection`` of glyph
+outlines instead of one ``Text`` artist per label, which is much faster
+to render but turns the text into shapes.  Vector output, where the
+names should stay selectable and searchable text, can ask for ``Text``
+artists instead.
+
+"""
+import numpy as np
+from matplotlib.collections import PathCollection
+from matplotlib.colors import to_rgba
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import TextPath
+from matplotlib.transforms import Affine2D
+
+
+def in_box(x, y, limit):
+    """Return a True/False mask of the points inside the square field."""
+    return (-limit < x) & (x < limit) & (-limit < y) & (y < limit)
+
+
+class Labeller:
+    """Collect label candidates for an axes and draw the ones that fit."""
+
+    def __init__(self, ax, limit):
+        self.ax = ax
+        self.limit = limit
+        self.groups = []
+        self._text_paths = {}
+
+    def add(self, x, y, texts, priority=0, rank=None, offset=(0.0, 0.0),
+            ha='left', va='top', fontsize=8, weight='bold', color='black',
+            alpha=1.0, collide=True):
+        """Add a group of label candidates.
+
+        Groups with a lower ``priority`` win overlaps, and within a group
+        the lower ``rank`` (typically the magnitude) wins.  Labels added
+        with ``collide=False`` are always drawn and never block others,
+        which suits large faint background names.
+
+        """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        texts = np.asarray(texts, dtype=object)
+        rank = np.zeros(len(x)) if rank is None else np.asarray(rank, dtype=float)
+
+        keep = np.isfinite(x) & np.isfinite(y) & in_box(x, y, self.limit)
+        self.groups.append({
+            'x': x[keep] + offset[0],
+            'y': y[keep] + offset[1],
+            'texts': texts[keep],
+            'rank': rank[keep],
+            'priority': priority,
+            'ha': ha,
+            'va': va,
+            'prop': FontProperties(size=fontsize, weight=weight),
+            'color': to_rgba(color, alpha),
+            'collide': collide,
+        })
+
+    def _text_path(self, text, prop):
+        key = (text, prop.get_size_in_points(), prop.get_weight())
+        path = self._text_paths.get(key)
+        if path is None:
+            path = self._text_paths[key] = TextPath((0, 0), text, prop=prop)
+        return path
+
+    def _aligned(self, path, ha, va):
+        # Shift the glyph outlines so that (0, 0) is the anchor point.
+        (x0, y0), (x1, y1) = path.get_extents().get_points()
+        dx = {'left': -x0, 'center': -(x0 + x1) / 2.0, 'right': -x1}[ha]
+        dy = {'bottom': -y0, 'center': -(y0 + y1) / 2.0, 'top': -y1}[va]
+        return path.transformed(Affine2D().translate(dx, dy))
+
+    def place(self):
+        """Return the labels that survive, as (group, index, path) tuples."""
+        ax = self.ax
+        ax.apply_aspect()
+        data_per_point = (2.0 * self.limit / ax.get_window_extent().width
+                          * ax.figure.dpi / 72.0)
+
+        candidates = []
+        for g, group in enumerate(self.groups):
+            for i in np.argsort(group['rank'], kind='stable'):
+                path = self._aligned(
+                    self._text_path(group['texts'][i], group['prop']),
+                    group['ha'], group['va'])
+                (x0, y0), (x1, y1) = path.get_extents().get_points() * data_per_point
+                box = (group['x'][i] + x0, group['y'][i] + y0,
+                       group['x'][i] + x1, group['y'][i] + y1)
+                candidates.append((group['priority'], g, i, path, box))
+        candidates.sort(key=lambda c: c[0])
+
+        # Boxes that were accepted are filed under every grid cell they
+        # touch, so each candidate only checks its own neighbourhood.
+
+        cell = max([c[4][3] - c[4][1] for c in candidates if self.groups[c[1]]['collide']]
+                   or [1.0])
+        grid = {}
+        placed = []
+        for priority, g, i, path, box in candidates:
+            if not self.groups[g]['collide']:
+                placed.append((g, i, path))
+                continue
+            cells = [(cx, cy)
+                     for cx in range(int(np.floor(box[0] / cell)), int(np.floor(box[2] / cell)) + 1)
+                     for cy in range(int(np.floor(box[1] / cell)), int(np.floor(box[3] / cell)) + 1)]
+            if any(box[0] < other[2] and other[0] < box[2] and
+                   box[1] < other[3] and other[1] < box[3]
+                   for c in cells for other in grid.get(c, ())):
+                continue
+            for c in cells:
+                grid.setdefault(c, []).append(box)
+            placed.append((g, i, path))
+        return placed
+
+    def draw(self, zorder=1, outlines=True):
+        """Place the labels and add them to the axes.
+
+        Returns the one ``PathCollection`` of glyph outlines, or without
+        ``outlines`` the list of ``Text`` artists.  Neither is clipped to
+        the horizon of a chart.
+
+        """
+        placed = self.place()
+        if not outlines:
+            return [self.ax.text(self.groups[g]['x'][i], self.groups[g]['y'][i],
+                                 self.groups[g]['texts'][i], ha=self.groups[g]['ha'],
+                                 va=self.groups[g]['va'],
+                                 fontproperties=self.groups[g]['prop'],
+                                 color=self.groups[g]['color'], zorder=zorder)
+                    for g, i, path in placed]
+
+        paths = [path for g, i, path in placed]
+        offsets = np.array([(self.groups[g]['x'][i], self.groups[g]['y'][i])
+                            for g, i, path in placed]).reshape(-1, 2)
+        colors = [self.groups[g]['color'] for g, i, path in placed]
+
+        # The glyph outlines are in points; the offsets are data positions.
+
+        fig = self.ax.figure
+        collection = PathCollection(
+            paths, offsets=offsets, offset_transform=self.ax.transData,
+            transform=Affine2D().scale(1.0 / 72.0) + fig.dpi_scale_trans,
+            facecolors=colors, edgecolors='none', zorder=zorder,
+        )
+        self.ax.add_collection(collection, autolim=False)
+        return collection
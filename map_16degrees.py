@@ -1,121 +1,339 @@
+"""Render a finder chart for every Messier object.
+
+``FinderCharts`` holds everything the charts of one epoch share, and
+renders them one by one to PNG files or all together into a printable
+PDF atlas.  Its steps take a ``stage`` hook, which benchmark.py uses to
+time them.
+
+"""
+import argparse
+import os
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
 from matplotlib import pyplot as plt
 
-from skyfield.api import Star, load, wgs84, N, S, W, E
-from skyfield.data import hipparcos, mpc, stellarium
+from skyfield.api import load
 import dsos
-from starmap_utils import get_target, get_limit, add_telrad_circles, add_constellations
-from skyfield.projections import build_stereographic_projection
+import catalog_cache
+import constellation_figures
+from starmap_utils import get_limit, generate_constellation_lines, no_stage
+from chart_template import ChartTemplate
+from projection_engine import ProjectionEngine
+from sky_index import SkyIndex
+from dense_catalog import DenseCatalog
+from batch_render import render_batch
+from render_cache import RenderCache
 from datetime import datetime
 from pytz import timezone
 
-# time `t` we use for everything else.
-
-AMS = timezone('Europe/Amsterdam')
-ts = load.timescale()
-t = ts.from_datetime(AMS.localize(datetime(2022, 1, 19, 22, 0, 0)))
-# 180 = South 0 = North
-degrees = 0.0
-
-
-amsterdam = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28).at(t)
-position = amsterdam.from_altaz(alt_degrees=90, az_degrees=degrees)
-
-# An ephemeris from the JPL provides Sun and Earth positions.
-
-eph = load('de421.bsp')
-sun = eph['sun']
-earth = eph['earth']
-
-# The Hipparcos mission provides our star catalog.
-
-with load.open(hipparcos.URL) as f:
-    stardata = hipparcos.load_dataframe(f)
-
-# DSO's from stellarium
-
-with open('data/catalog.txt') as f:
-    dsodata = dsos.load_dataframe(f)
-
-# And the constellation outlines come from Stellarium.  We make a list
-# of the stars at which each edge stars, and the star at which each edge
-# ends.
-
-url = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
-       '/skycultures/modern_st/constellationship.fab')
-
-with load.open(url) as f:
-    consdata = stellarium.parse_constellations(f)
-
-url2 = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
-       '/skycultures/modern_st/star_names.fab')
-
-with load.open(url2) as f2:
-    star_names = stellarium.parse_star_names(f2)
-
-
-# Center on Orion nebula as an example
-# select the DSO you want centered in the view
-# target = (dsodata.label == "M42")
-# hip, target_dso = get_target(dsodata, target)
-
-field_of_view_degrees = 18.0
-limiting_magnitude = 4.0
-dso_limit_magnitude = 6.0
-
-for i, d in dsodata.iterrows():
-    hip = i
-    target_dso = d
-    dso = Star.from_dataframe(d)
-
-    center = earth.at(t).observe(dso)
-    projection = build_stereographic_projection(center)
-
-    # Now that we have constructed our projection, compute the x and y
-    # coordinates that each star will have on the plot.
-
-    star_positions = earth.at(t).observe(Star.from_dataframe(stardata))
-    stardata['x'], stardata['y'] = projection(star_positions)
-
-    # Create a True/False mask marking the stars bright enough to be
-    # included in our plot.  And go ahead and compute how large their
-    # markers will be on the plot.
-
-    bright_stars = (stardata.magnitude <= limiting_magnitude)
-    magnitude = stardata['magnitude'][bright_stars]
-    marker_size = (0.6 + limiting_magnitude - magnitude) ** 2.0
-
-    # Time to build the figure!
-
-    fig, ax = plt.subplots(figsize=[2.0976, 2.0976], dpi=281.94)
-
-    # Draw telrad circles
-
-    add_telrad_circles(ax, 'black', 'white')
-
-    # Draw the constellation lines.
-
-    add_constellations(ax, consdata, stardata, 'black')
-
-    # Draw the stars.
-
-    ax.scatter(stardata['x'][bright_stars], stardata['y'][bright_stars],
-               s=marker_size, color='black')
-
-    # Finally, title the plot and set some final parameters.
-
-    limit = get_limit(field_of_view_degrees)
-
-    ax.text(0, -0.05, target_dso['label'], color='black',
-            ha='center', va='top', fontsize=8, weight='bold', zorder=1).set_alpha(0.5)
-
-    ax.set_xlim(-limit, limit)
-    ax.set_ylim(-limit, limit)
-    ax.xaxis.set_visible(False)
-    ax.yaxis.set_visible(False)
-    ax.set_aspect(1.0)
-
-    # Save.
-    plt.style.context('dark_background')
-    plt.axis('off')
-    fig.savefig(f"images/{target_dso['label']}.png", bbox_inches='tight', pad_inches=0, facecolor='white')
-    plt.close(fig)
+# The figure, telrad rings and styling are the same for every chart, so
+# each process builds them once and only moves the stars, the lines and
+# the label for every target.  Bump the version whenever the template
+# changes, so that the render cache draws every chart again.
+
+chart_style = {'version': 1, 'figsize': [2.0976, 2.0976], 'dpi': 281.94}
+
+# The charts can also go into one printable atlas, several to a sheet.
+# Like the template, the sheet and its grid of charts are built once and
+# every page only updates their layers before it is appended to the PDF,
+# so no earlier page is kept in memory.  PdfPages writes the fonts,
+# subset to the glyphs of all pages, once at the end of the file.
+
+sheet_size = [8.27, 11.69]  # A4 portrait, in inches
+
+
+def add_chart_layers(chart):
+    chart.add_telrad_circles('black', 'white')
+    chart.add_lines('constellations', colors='black', linewidths=0.25,
+                    zorder=-1, alpha=0.5)
+    chart.add_scatter('stars', color='black')
+    chart.add_text('label', 0, -0.05, color='black', ha='center', va='top',
+                   fontsize=8, weight='bold', zorder=1, alpha=0.5)
+
+
+def update_chart(chart, label, layers):
+    chart.set_lines('constellations', layers['lines'])
+    chart.set_scatter('stars', layers['stars'], layers['marker_size'])
+    chart.set_text('label', label)
+
+
+def field_lines(lines, limit):
+    """The segments of ``lines`` whose bounding box reaches the chart.
+
+    A PNG clips the rest away for free, but a PDF would keep every
+    figure line of the sky on every page.
+
+    """
+    lo = lines.min(axis=1)
+    hi = lines.max(axis=1)
+    return lines[(lo[:, 0] <= limit) & (hi[:, 0] >= -limit)
+                 & (lo[:, 1] <= limit) & (hi[:, 1] >= -limit)]
+
+
+class FinderCharts:
+    """The finder charts of every DSO of ``dsodata`` at the epoch ``t``.
+
+    The apparent positions only depend on `t`, so every star and every
+    DSO is observed once and the cached vectors are just rotated for
+    each target.  With ``dense``, a ``DenseCatalog``, every chart streams
+    the stars of its own field from disk and observes only those.  With
+    a ``RenderCache`` the charts whose digest did not change are not
+    rendered again.
+
+    """
+    def __init__(self, earth, t, stardata, dsodata, figures, dense=None, cache=None,
+                 directory='images', field_of_view_degrees=18.0, limiting_magnitude=4.0):
+        self.t = t
+        self.stardata = stardata
+        self.dsodata = dsodata
+        self.figures = figures
+        self.dense = dense
+        self.cache = cache
+        self.directory = directory
+        self.field_of_view_degrees = field_of_view_degrees
+        self.limiting_magnitude = limiting_magnitude
+
+        self.observer = earth.at(t)
+        self.stars = ProjectionEngine(self.observer, stardata)
+        self.star_index = SkyIndex(stardata)
+        self.targets = ProjectionEngine(self.observer, dsodata)
+
+        # Radius of the circle through the corners of the chart.
+
+        self.field_radius = field_of_view_degrees / np.sqrt(2.0)
+        self.limit = get_limit(field_of_view_degrees)
+        self.template = None
+
+    def __len__(self):
+        return len(self.dsodata)
+
+    def filename(self, label):
+        return os.path.join(self.directory, f'{label}.png')
+
+    def chart_template(self):
+        """The chart of this process, built on first use."""
+        if self.template is None:
+            self.template = ChartTemplate(self.limit, figsize=chart_style['figsize'],
+                                          dpi=chart_style['dpi'])
+            add_chart_layers(self.template)
+        return self.template
+
+    def chart_spec(self, label, center):
+        """Everything besides the drawn arrays that decides how a chart looks."""
+        return {
+            'style': chart_style,
+            'label': label,
+            'epoch': self.t.tt,
+            'center': center.tolist(),
+            'field_of_view': self.field_of_view_degrees,
+            'limiting_magnitude': self.limiting_magnitude,
+        }
+
+    def chart_layers(self, n):
+        """Return the label, center and drawn arrays of the chart for the n-th DSO."""
+        stardata = self.stardata
+        target_dso = self.dsodata.iloc[n]
+        center = self.targets.unit[:, n]
+
+        # Now that we have chosen the center, compute the x and y
+        # coordinates that each star will have on the plot.
+
+        stardata['x'], stardata['y'] = self.stars.project(center)
+
+        # Look up the stars inside the field that are bright enough to be
+        # included in our plot.  And go ahead and compute how large their
+        # markers will be on the plot.
+
+        if self.dense is None:
+            bright_stars = self.star_index.query(center, self.field_radius,
+                                                 self.limiting_magnitude)
+            star_x = stardata['x'].values[bright_stars]
+            star_y = stardata['y'].values[bright_stars]
+            magnitude = stardata['magnitude'].values[bright_stars]
+        else:
+            field = self.dense.cone(center, self.field_radius, self.limiting_magnitude)
+            star_x, star_y = ProjectionEngine(self.observer, field).project(center)
+            magnitude = field['magnitude'].values
+        marker_size = (0.6 + self.limiting_magnitude - magnitude) ** 2.0
+        lines = generate_constellation_lines(self.figures, stardata)
+        star_xy = np.column_stack([star_x, star_y])
+        return target_dso['label'], center, {'lines': lines, 'stars': star_xy,
+                                             'marker_size': marker_size}
+
+    def render_chart(self, n, stage=no_stage):
+        """Render the finder chart for the n-th DSO to `<directory>/<label>.png`.
+
+        Returns ``(label, digest, rendered)``.  A chart whose digest is in
+        the manifest of ``cache`` is not drawn or saved again, which is
+        most of the time of a chart.  The digest covers the stars and
+        lines on the chart, though, so they are still projected first.
+
+        """
+        with stage('projection'):
+            label, center, layers = self.chart_layers(n)
+        filename = self.filename(label)
+        digest = None
+        if self.cache is not None:
+            digest = self.cache.digest(self.chart_spec(label, center), layers)
+            if self.cache.fresh(label, digest, filename):
+                return label, digest, False
+
+        # Update the chart: the constellation lines, the stars and the label.
+
+        with stage('collections'):
+            chart = self.chart_template()
+            update_chart(chart, label, layers)
+
+        # Save.
+        with stage('savefig'):
+            chart.save(filename, bbox_inches='tight', pad_inches=0, facecolor='white')
+        return label, digest, True
+
+    def atlas_sheet(self, columns, rows):
+        """Return a sheet figure and the charts on it, in reading order."""
+        fig = plt.figure(figsize=sheet_size)
+        fig.subplots_adjust(left=0.04, right=0.96, bottom=0.03, top=0.97,
+                            wspace=0.08, hspace=0.08)
+        charts = []
+        for ax in fig.subplots(rows, columns, squeeze=False).ravel():
+            chart = ChartTemplate(self.limit, ax=ax)
+            add_chart_layers(chart)
+            charts.append(chart)
+        return fig, charts
+
+    def render_atlas(self, filename, columns=3, rows=4, stage=no_stage):
+        """Render every finder chart into the multi-page PDF ``filename``.
+
+        The charts run by Messier number, M1 to M110, ``columns`` by
+        ``rows`` to a sheet, and any objects without one follow in
+        catalog order.  Returns the number of pages.
+
+        """
+        from matplotlib.backends.backend_pdf import PdfPages
+
+        messier = self.dsodata['messier_id'].values
+        order = np.lexsort((self.dsodata.index.values, messier, messier == 0))
+        fig, charts = self.atlas_sheet(columns, rows)
+        pages = 0
+        try:
+            with PdfPages(filename, metadata={'Title': 'Finder charts'}) as pdf:
+                for start in range(0, len(order), len(charts)):
+                    page = order[start:start + len(charts)]
+                    for chart, n in zip(charts, page):
+                        with stage('projection'):
+                            label, center, layers = self.chart_layers(n)
+                        with stage('collections'):
+                            layers['lines'] = field_lines(layers['lines'], self.limit)
+                            update_chart(chart, label, layers)
+                            chart.ax.set_visible(True)
+                    for chart in charts[len(page):]:
+                        chart.ax.set_visible(False)
+                    with stage('savefig'):
+                        pdf.savefig(fig)
+                    pages += 1
+        finally:
+            plt.close(fig)
+        return pages
+
+
+def atlas_grid(text):
+    """Parse the ``--grid`` of an atlas sheet, like ``3x4``, into columns and rows."""
+    try:
+        columns, rows = (int(n) for n in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'expected columns x rows, like 3x4, not {text!r}')
+    if columns < 1 or rows < 1:
+        raise argparse.ArgumentTypeError(f'a sheet needs at least one column and row, not {text!r}')
+    return columns, rows
+
+
+# The charts being rendered, for the forked workers.
+
+_charts = None
+
+
+def _render_chart(n):
+    return _charts.render_chart(n)
+
+
+def render_charts(charts, processes=None):
+    """Render every finder chart of ``charts`` and update its manifest.
+
+    Yields ``(label, rendered)`` for every chart, in order.
+
+    """
+    global _charts
+    _charts = charts
+    try:
+        for label, digest, rendered in render_batch(_render_chart, range(len(charts)),
+                                                    processes):
+            if charts.cache is not None:
+                charts.cache.record(label, digest)
+            yield label, rendered
+    finally:
+        _charts = None
+        if charts.cache is not None:
+            charts.cache.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a finder chart for every DSO.')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--catalog', help='draw the stars of a dense catalog converted by'
+                        ' dense_catalog.py instead of the Hipparcos stars')
+    parser.add_argument('--limiting-magnitude', type=float, default=4.0)
+    parser.add_argument('--atlas', help='write every chart into this multi-page PDF instead')
+    parser.add_argument('--grid', type=atlas_grid, default='3x4',
+                        help='charts per atlas sheet, as columns x rows (default: %(default)s)')
+    args = parser.parse_args()
+
+    # time `t` we use for everything else.
+
+    AMS = timezone('Europe/Amsterdam')
+    ts = load.timescale()
+    t = ts.from_datetime(AMS.localize(datetime(2022, 1, 19, 22, 0, 0)))
+
+    # An ephemeris from the JPL provides Sun and Earth positions.
+
+    eph = load('de421.bsp')
+    earth = eph['earth']
+
+    # The Hipparcos mission provides our star catalog.
+
+    stardata = catalog_cache.load_hipparcos()
+
+    # DSO's from stellarium
+
+    dsodata = dsos.load_catalog('data/catalog.txt')
+
+    # And the constellation outlines come from Stellarium.  They are compiled
+    # into the positions in `stardata` of the star at which each edge starts,
+    # and the star at which each edge ends.
+
+    figures = constellation_figures.load('modern_st', stardata)
+
+    dense = DenseCatalog(args.catalog) if args.catalog else None
+
+    # The digests of the charts already in `images`, kept in the catalog
+    # cache.  A chart is only drawn again when its parameters or the stars
+    # and lines on it change.
+
+    charts = FinderCharts(earth, t, stardata, dsodata, figures, dense=dense,
+                          cache=RenderCache('images'),
+                          limiting_magnitude=args.limiting_magnitude)
+
+    if args.atlas:
+        columns, rows = args.grid
+        pages = charts.render_atlas(args.atlas, columns, rows)
+        print(f'{len(dsodata)} charts on {pages} pages in {args.atlas}')
+    else:
+        rendered = skipped = 0
+        for label, done in render_charts(charts, args.processes):
+            if done:
+                rendered += 1
+                print(charts.filename(label))
+            else:
+                skipped += 1
+        print(f'{rendered} charts rendered, {skipped} unchanged')
@@ -1,69 +1,53 @@
-from skyfield.api import Star, load, wgs84, N, S, W, E, position_of_radec, load_constellation_map, load_constellation_names
+import argparse
+
+from skyfield.api import load, wgs84, N, E
 import dsos
-import constellation_bounds
-import constellation_centers
+import catalog_cache
+from catalog_export import CatalogExport
 from datetime import datetime
 from pytz import timezone
-import json
-from skyfield.functions import load_bundled_npy
-a = load_bundled_npy('constellations.npz')
-print(a['sorted_ra'])
-print(a['sorted_dec'])
-print(a['radec_to_index'])
-print(a['indexed_abbreviations'])
 
 # time `t` we use for everything else.
 
 AMS = timezone('Europe/Amsterdam')
 ts = load.timescale()
 t = ts.from_datetime(AMS.localize(datetime(2022, 1, 19, 22, 0, 0)))
-# 180 = South 0 = North
-degrees = 0.0
-
-
-amsterdam = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28).at(t)
-position = amsterdam.from_altaz(alt_degrees=90, az_degrees=degrees)
-
-# An ephemeris from the JPL provides Sun and Earth positions.
-
-# DSO's from stellarium
-
-with open('data/catalog.txt') as f:
-    dsodata = dsos.load_dataframe(f)
-
-with open('data/lines_in_18.txt') as fc:
-    constdata = constellation_bounds.load_dataframe(fc)
-
-with open('data/centers_18.txt') as fc:
-    centersdata = constellation_centers.load_dataframe(fc)
-
-
-class Constellation:
-    def __init__(self):
-        self.find_constellation = load_constellation_map()
-        self.names = dict(load_constellation_names())
-        print(f"constellations = {self.names}")
-
-    def __call__(self, ra, dec):
-        p = position_of_radec(ra, dec)
-        abrv = self.find_constellation(p)
-        name = self.names.get(abrv)
-        return f"{name} ({abrv})"
-
-
-in_constellation = Constellation()
-def transform(data):
-    return {
-        "Name": data["label"],
-        "Constellation": in_constellation(data["ra_hours"], data["dec_degrees"]),
-        "Magnitude": data["magnitude"],
-        "Right Ascention": data["ra_degrees"],
-        "Declination": data["dec_degrees"],
-    }
 
-with open('messier_data.json', 'w') as output:
-    for i, d in dsodata.iterrows():
-        output.write(json.dumps(transform(dict(d)))+"\n")
+site = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the DSOs with the constellation they are in.')
+    parser.add_argument('--output', default='messier_data.json',
+                        help='JSON Lines, .csv or .parquet file (default: %(default)s)')
+    parser.add_argument('--catalogs', nargs='*', default=['M'],
+                        help="DSO catalogs to export, from M, NGC and IC; none for all")
+    parser.add_argument('--stars', help='also export the Hipparcos stars to this file')
+    parser.add_argument('--horizon', action='store_true',
+                        help='add altitude, azimuth, rise and set for Amsterdam at `t`')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='number of worker processes (default: %(default)s)')
+    args = parser.parse_args()
+
+    observer = None
+    if args.horizon:
+        eph = load('de421.bsp')
+        observer = (eph['earth'] + site).at(t)
+
+    # DSO's from stellarium
+
+    # The catalog is stored in magnitude order; export it in catalog order.
+
+    dsodata = dsos.load_catalog('data/catalog.txt', catalogs=args.catalogs or None).sort_index()
+    export = CatalogExport(dsodata, dsodata['label'].values, observer, site, args.chunk_size)
+    export.write(args.output, args.processes)
+
+    if args.stars:
+        stardata = catalog_cache.load_hipparcos()
+        names = ('HIP ' + stardata.index.astype(str)).values
+        export = CatalogExport(stardata, names, observer, site, args.chunk_size)
+        export.write(args.stars, args.processes)
 
 
 # edge18.txt format
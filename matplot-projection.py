@@ -1,3 +1,5 @@
+import weakref
+
 import numpy as np
 
 import matplotlib
@@ -12,6 +14,11 @@ from matplotlib.transforms import Affine2D, BboxTransformTo, Transform
 from skyfield.api import Star, load, wgs84, N, S, W, E
 from skyfield.data import hipparcos, mpc, stellarium
 from matplotlib.collections import LineCollection
+import catalog_cache
+import constellation_bounds
+import constellation_figures
+import dsos
+import raster
 
 rcParams = matplotlib.rcParams
 
@@ -369,14 +376,23 @@ class HammerAxes(GeoAxes):
         """The base Hammer transform."""
         input_dims = output_dims = 2
 
-        def __init__(self, resolution):
+        # The largest step, in radians, taken along a line without
+        # checking how much it bends.
+        max_step = np.pi / 8
+
+        def __init__(self, resolution, tolerance=1e-3):
             """
-            Create a new Hammer transform.  Resolution is the number of steps
-            to interpolate between each input line segment to approximate its
-            path in curved Hammer space.
+            Create a new Hammer transform.  Line segments are subdivided
+            until the projected curve strays less than `tolerance` from its
+            chords, in the projected units (the map is 4 * sqrt(2) wide, so
+            1e-3 is below a pixel for maps up to about 5000 pixels wide).
+            Resolution is the largest number of steps a segment is split into.
             """
             Transform.__init__(self)
             self._resolution = resolution
+            self._tolerance = tolerance
+            self._max_depth = int(np.ceil(np.log2(max(resolution, 1))))
+            self._paths = weakref.WeakKeyDictionary()
 
         def transform_non_affine(self, ll):
             longitude, latitude = ll.T
@@ -392,19 +408,88 @@ class HammerAxes(GeoAxes):
             return np.column_stack([x, y])
 
         def transform_path_non_affine(self, path):
-            # vertices = path.vertices
-            ipath = path.interpolated(self._resolution)
-            return Path(self.transform(ipath.vertices), ipath.codes)
+            # The transformed paths are cached, so that redrawing (panning,
+            # zooming, saving again) only redoes the affine part.  A path
+            # whose vertices changed since is transformed again.
+            codes = path.codes
+            key = (hash(path.vertices.tobytes()),
+                   None if codes is None else hash(codes.tobytes()),
+                   self._tolerance)
+            cached = self._paths.get(path)
+            if cached is not None and cached[0] == key:
+                return cached[1]
+
+            if codes is not None and np.isin(codes, (Path.CURVE3, Path.CURVE4)).any():
+                ipath = path.interpolated(self._resolution)
+                tpath = Path(self.transform_non_affine(ipath.vertices), ipath.codes)
+            else:
+                tpath = Path(*self.transform_lines(path.vertices, codes))
+            self._paths[path] = (key, tpath)
+            return tpath
+
+        def transform_lines(self, vertices, codes):
+            """Transform straight line segments, splitting them where they bend.
+
+            Every segment is halved until the projected midpoint lies
+            within the tolerance of the projected chord, or after
+            `_max_depth` halvings.  All segments of a path are refined
+            together, one level at a time, and only the new midpoints are
+            transformed at each level.  Returns the transformed vertices
+            and the codes.
+            """
+            vertices = np.asarray(vertices, dtype=float)
+            projected = self.transform_non_affine(vertices)
+            if codes is None:
+                starts = np.arange(len(vertices) - 1)
+            else:
+                starts = np.flatnonzero(codes[1:] == Path.LINETO)
+            a = vertices[starts]
+            d = vertices[starts + 1] - a
+            length = np.hypot(d[:, 0], d[:, 1])
+
+            segment = np.arange(len(starts))
+            s0 = np.zeros(len(starts))
+            s1 = np.ones(len(starts))
+            p0 = projected[starts]
+            p1 = projected[starts + 1]
+            new_segment, new_s, new_points = [], [], []
+            for depth in range(self._max_depth):
+                if not len(segment):
+                    break
+                mid = (s0 + s1) / 2
+                pm = self.transform_non_affine(a[segment] + mid[:, None] * d[segment])
+                error = pm - (p0 + p1) / 2
+                split = ((np.hypot(error[:, 0], error[:, 1]) > self._tolerance)
+                         | ((s1 - s0) * length[segment] > self.max_step))
+
+                segment, mid, pm = segment[split], mid[split], pm[split]
+                new_segment.append(segment)
+                new_s.append(mid)
+                new_points.append(pm)
+                segment = np.concatenate([segment, segment])
+                s0, s1 = np.concatenate([s0[split], mid]), np.concatenate([mid, s1[split]])
+                p0, p1 = np.concatenate([p0[split], pm]), np.concatenate([pm, p1[split]])
+
+            segment = np.concatenate(new_segment or [segment])
+            if not len(segment):
+                return projected, codes
+            order = np.lexsort((np.concatenate(new_s), segment))
+            positions = starts[segment[order]] + 1
+            projected = np.insert(projected, positions, np.concatenate(new_points)[order], axis=0)
+            if codes is not None:
+                codes = np.insert(codes, positions, Path.LINETO)
+            return projected, codes
 
         def inverted(self):
-            return HammerAxes.InvertedHammerTransform(self._resolution)
+            return HammerAxes.InvertedHammerTransform(self._resolution, self._tolerance)
 
     class InvertedHammerTransform(Transform):
         input_dims = output_dims = 2
 
-        def __init__(self, resolution):
+        def __init__(self, resolution, tolerance=1e-3):
             Transform.__init__(self)
             self._resolution = resolution
+            self._tolerance = tolerance
 
         def transform_non_affine(self, xy):
             x, y = xy.T
@@ -414,7 +499,7 @@ class HammerAxes(GeoAxes):
             return np.column_stack([longitude, latitude])
 
         def inverted(self):
-            return HammerAxes.HammerTransform(self._resolution)
+            return HammerAxes.HammerTransform(self._resolution, self._tolerance)
 
     def __init__(self, *args, **kwargs):
         self._longitude_cap = np.pi / 2.0
@@ -429,59 +514,101 @@ class HammerAxes(GeoAxes):
 # Now register the projection with Matplotlib so the user can select it.
 register_projection(HammerAxes)
 
-# And the constellation outlines come from Stellarium.  We make a list
-# of the stars at which each edge stars, and the star at which each edge
-# ends.
+# The Hipparcos mission provides our star catalog.
 
-url = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
-       '/skycultures/western_SnT/constellationship.fab')
+stardata = catalog_cache.load_hipparcos()
 
-with load.open(url) as f:
-    consdata = stellarium.parse_constellations(f)
+# And the constellation outlines come from Stellarium, compiled into the
+# positions in `stardata` of the star at which each edge starts, and the
+# star at which each edge ends.
 
-# The Hipparcos mission provides our star catalog.
-
-with load.open(hipparcos.URL) as f:
-    stardata = hipparcos.load_dataframe(f)
+figures = constellation_figures.load('western_SnT', stardata)
 
 rad = 360.0 / (2*np.pi)
 
 def transform_radecs(data):
     return [[(ra-180)/rad, dec/rad] for ra, dec in data]
 
-def generate_constellation_lines(data):
-    edges = [edge for name, edges in data for edge in edges]
+def generate_constellation_lines(figures):
+    ra = stardata['ra_degrees'].values
+    dec = stardata['dec_degrees'].values
+    lon = (ra - 180) / rad
+    lat = dec / rad
     result = {}
-    for name, edges in data:
-        stars = [s1 for s1, s2 in edges]+[edges[-1][1]]
-        radecs = stardata[['ra_degrees', 'dec_degrees']].loc[stars].values
-
-        edges_star1 = [star1 for star1, star2 in edges]
-        edges_star2 = [star2 for star1, star2 in edges]
-        radecs1 = stardata[['ra_degrees', 'dec_degrees']].loc[edges_star1].values
-        radecs2 = stardata[['ra_degrees', 'dec_degrees']].loc[edges_star2].values
+    for name, start, stop in zip(figures.names, figures.offsets[:-1], figures.offsets[1:]):
+        if start == stop:
+            continue
+        edges = slice(start, stop)
+        stars = np.append(figures.star1[edges], figures.star2[stop - 1])
         result[name] = {
-            'stars': [[ra, dec] for ra, dec in radecs],
-            'ra': [(ra-180)/rad for ra, dec in radecs],
-            'dec': [dec/rad for ra, dec in radecs],
-            'lines': np.rollaxis(np.array([transform_radecs(radecs1), transform_radecs(radecs2)]), 1)
+            'stars': np.column_stack([ra[stars], dec[stars]]).tolist(),
+            'ra': lon[stars].tolist(),
+            'dec': lat[stars].tolist(),
+            'lines': figures.segments(lon, lat, edges),
         }
     return result
 
 
+def star_radius(magnitude, limiting_magnitude):
+    """Marker radius in points, from about 0.1 at the limit to 2 at magnitude -1.5."""
+    return 0.18 * (0.7 + limiting_magnitude - magnitude)
+
+
 if __name__ == '__main__':
+    import argparse
     import matplotlib.pyplot as plt
 
-    # Now make a simple example using the custom projection.
-    fig, ax = plt.subplots(subplot_kw={'projection': 'custom_hammer'})
-    # ra and dec in radian for UMi
-    # ra = [-2.4793074519138867, 1.449561188726586, 1.2477767161484585, 0.9776362865821601, 1.1235921428610776, 0.8758461587653573, 0.7448480127625399, 0.9776362865821601]
-    # dec = [1.5579531129272506, 1.5112165324538394, 1.4318201341735557, 1.357770147663969, 1.3221690060557245, 1.253739345034972, 1.2942572138855029, 1.357770147663969]
-    # ax.plot(ra, dec, "o-")
-    for name, pos in generate_constellation_lines(consdata).items():
+    parser = argparse.ArgumentParser(description='Draw an all-sky Hammer map of the whole catalog.')
+    parser.add_argument('--output', help='save to this file instead of showing the map')
+    parser.add_argument('--dpi', type=float, default=150)
+    parser.add_argument('--limiting-magnitude', type=float, default=9.0)
+    parser.add_argument('--dso-limit-magnitude', type=float, default=10.0)
+    parser.add_argument('--vector', action='store_true',
+                        help='scatter the stars as markers instead of one raster layer (slow)')
+    args = parser.parse_args()
+
+    fig, ax = plt.subplots(subplot_kw={'projection': 'custom_hammer'},
+                           figsize=[24, 12], dpi=args.dpi)
+
+    # Constellation borders, as one line per border segment, broken where
+    # a segment runs across the map from RA 0h to 24h.
+
+    constdata = constellation_bounds.load_boundaries()
+    order = np.argsort(constdata.index.values, kind='stable')
+    segment = constdata.index.values[order]
+    border_ra = constdata['ra_hours'].values[order] * 15.0
+    border_dec = constdata['dec_degrees'].values[order]
+    breaks = np.flatnonzero((segment[1:] != segment[:-1])
+                            | (np.abs(np.diff(border_ra)) > 180.0)) + 1
+    lonlat = np.column_stack([(border_ra - 180) / rad, border_dec / rad])
+    ax.add_collection(LineCollection(np.split(lonlat, breaks),
+                                     colors='black', linewidths=0.5, zorder=2, alpha=0.5,
+                                     linestyles='dashed'), autolim=False)
+
+    for name, pos in generate_constellation_lines(figures).items():
         ax.add_collection(LineCollection(pos['lines'],
-                       colors='grey', linewidths=1, zorder=-1, alpha=0.5))
-        ax.plot(pos['ra'], pos['dec'], "o")
+                       colors='grey', linewidths=1, zorder=2, alpha=0.5), autolim=False)
+
+    dsodata = dsos.load_catalog('data/catalog.txt', catalogs=None,
+                                limiting_magnitude=args.dso_limit_magnitude)
+    ax.scatter((dsodata['ra_degrees'].values - 180) / rad, dsodata['dec_degrees'].values / rad,
+               s=4, color='red', alpha=0.65, zorder=3, linewidths=0)
     ax.grid()
 
-    plt.show()
+    # Every star down to the limit, a leading slice of the magnitude
+    # sorted catalog.  The Hammer math runs once over the arrays and the
+    # disks are splatted into one image at the figure dpi.
+
+    stars = stardata.iloc[:catalog_cache.brighter_than(stardata, args.limiting_magnitude)]
+    lon = (stars['ra_degrees'].values - 180) / rad
+    lat = stars['dec_degrees'].values / rad
+    radius = star_radius(stars['magnitude'].values, args.limiting_magnitude)
+    if args.vector:
+        ax.scatter(lon, lat, s=(2 * radius) ** 2, color='black', zorder=1, linewidths=0)
+    else:
+        raster.add_points(ax, lon, lat, radius, color='black', zorder=1)
+
+    if args.output:
+        fig.savefig(args.output)
+    else:
+        plt.show()
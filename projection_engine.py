@@ -0,0 +1,138 @@
+import numpy as np
+from skyfield.api import Star
+from skyfield.functions import length_of
+
+
+def unit_vectors(position):
+    """Return the (3, N) unit vectors pointing at a skyfield position."""
+    p = position.xyz.au
+    return p / length_of(p)
+
+
+def center_vector(center):
+    """Accept a skyfield position or a 3-vector and return a unit vector."""
+    if hasattr(center, 'xyz'):
+        u = unit_vectors(center)
+    else:
+        u = np.asarray(center, dtype=float)
+    return u / length_of(u)
+
+
+def stereographic_rotation(center):
+    """Return the rotation matrix used by the stereographic projection.
+
+    This is the same rotation as in skyfield's
+    ``build_stereographic_projection``, written out as a 3x3 matrix so
+    that a whole array of unit vectors can be rotated at once.  After
+    the rotation the center lies at (0, 0, -1).
+
+    """
+    x_c, y_c, z_c = center
+    t0 = 1.0 / np.sqrt(x_c**2 + y_c**2)
+    t2 = np.sqrt(1.0 - z_c**2)
+    return np.array([
+        [t0 * y_c, -t0 * x_c, 0.0],
+        [-t0 * z_c * x_c, -t0 * z_c * y_c, t2],
+        [-t0 * t2 * x_c, -t0 * t2 * y_c, -z_c],
+    ])
+
+
+def project_vectors(center, unit):
+    """Stereographic *x* and *y* of the (3, ...) ``unit`` vectors."""
+    xo, yo, zo = np.tensordot(stereographic_rotation(center_vector(center)), unit, axes=1)
+    return xo / (1.0 - zo), yo / (1.0 - zo)
+
+
+def hammer_projection(ra_degrees, dec_degrees):
+    """Hammer *x* and *y* of catalog coordinates, as on the custom_hammer axes.
+
+    RA 180 degrees lies on the central meridian.  The whole sky fits in
+    the ellipse x**2 / 8 + y**2 / 2 <= 1.
+
+    """
+    longitude = np.radians(np.asarray(ra_degrees, dtype=float) - 180.0)
+    latitude = np.radians(np.asarray(dec_degrees, dtype=float))
+    cos_latitude = np.cos(latitude)
+    alpha = np.sqrt(1.0 + cos_latitude * np.cos(longitude / 2.0))
+    x = 2.0 * np.sqrt(2.0) * cos_latitude * np.sin(longitude / 2.0) / alpha
+    y = np.sqrt(2.0) * np.sin(latitude) / alpha
+    return x, y
+
+
+class ProjectionEngine:
+    """Apparent positions of a catalog, computed once for one epoch.
+
+    The expensive astrometry (``observe``) runs a single time when the
+    engine is built and the result is kept as unit vectors.  Projecting
+    the catalog around a new center is then a matrix rotation of the
+    cached vectors.
+
+    """
+    def __init__(self, observer, data):
+        self.observer = observer
+        self.unit = unit_vectors(observer.observe(Star.from_dataframe(data)))
+
+    def cone(self, center, radius_degrees):
+        """Return a True/False mask of the objects within the radius."""
+        c = center_vector(center)
+        return c @ self.unit >= np.cos(np.radians(radius_degrees))
+
+    def project(self, center, index=None):
+        """Compute the stereographic *x* and *y* around ``center``.
+
+        Pass ``index`` (a mask or integer positions) to project only
+        part of the catalog, for example the stars inside the field.
+
+        """
+        unit = self.unit if index is None else self.unit[:, index]
+        return project_vectors(center, unit)
+
+
+# The columns of ``Star.from_dataframe``, with the value taken for a
+# layer that lacks one.
+
+STAR_COLUMNS = [
+    ('ra_hours', None),
+    ('dec_degrees', None),
+    ('ra_mas_per_year', 0.0),
+    ('dec_mas_per_year', 0.0),
+    ('parallax_mas', 0.0),
+    ('epoch_year', None),
+]
+
+
+class SkyTable:
+    """Several fixed-position layers stacked into one catalog.
+
+    Every layer, a dataframe with the columns of ``Star.from_dataframe``,
+    becomes a contiguous block of rows of ``columns``, so that all of
+    them are observed in one call, for example through
+    ``ProjectionEngine(observer, table.columns)``, and projected with
+    one rotation.  ``layer_id`` holds the layer of every row and
+    ``view`` hands a layer its block of a per-row array without copying.
+
+    """
+    def __init__(self, layers):
+        self.names = list(layers)
+        sizes = [len(data) for data in layers.values()]
+        self.offsets = np.append(0, np.cumsum(sizes))
+        self.layer_id = np.repeat(np.arange(len(sizes)), sizes)
+        self.columns = {}
+        for column, default in STAR_COLUMNS:
+            blocks = []
+            for data in layers.values():
+                values = data[column] if default is None else data.get(column, default)
+                blocks.append(np.broadcast_to(np.asarray(values, dtype=float), (len(data),)))
+            self.columns[column] = np.concatenate(blocks)
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def rows(self, name):
+        """Return the slice of the rows of layer ``name``."""
+        k = self.names.index(name)
+        return slice(self.offsets[k], self.offsets[k + 1])
+
+    def view(self, values, name):
+        """Return the block of layer ``name`` of a per-row array."""
+        return values[..., self.rows(name)]
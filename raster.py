@@ -0,0 +1,75 @@
+"""Draw large point sets as one image instead of one marker per point.
+
+Scattering a whole star catalog makes matplotlib push every marker
+through the axes transform and the renderer one at a time.  Here the
+points are projected once, as arrays, and splatted as anti-aliased
+disks into an alpha buffer the size of the axes in pixels.  The buffer
+is added to the axes as a single image, under the vector layers.
+
+The image is rendered for the figure's size and dpi at the time it is
+added, so add it after the layout is final and save at the figure dpi.
+
+"""
+import numpy as np
+from matplotlib.colors import to_rgb
+from matplotlib.image import AxesImage
+
+
+def splat(shape, x, y, radius):
+    """Return a (rows, columns) alpha buffer with a disk at every point.
+
+    ``x`` and ``y`` are pixel positions, with (0, 0) the corner of the
+    first pixel, and ``radius`` the disk radii in pixels.  The edges are
+    anti-aliased by the distance to the pixel centers and overlapping
+    disks keep the largest coverage.
+
+    """
+    height, width = shape
+    buffer = np.zeros(shape)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    radius = np.broadcast_to(np.asarray(radius, dtype=float), x.shape)
+    reach = np.ceil(radius + 0.5).astype(int)
+
+    # Disks with the same reach share one stencil of pixel offsets.
+
+    for r in np.unique(reach):
+        points = np.flatnonzero(reach == r)
+        dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+        px = x[points, None]
+        py = y[points, None]
+        ix = np.floor(px).astype(int) + dx.ravel()
+        iy = np.floor(py).astype(int) + dy.ravel()
+        coverage = np.clip(radius[points, None] + 0.5
+                           - np.hypot(ix + 0.5 - px, iy + 0.5 - py), 0.0, 1.0)
+        inside = (coverage > 0) & (ix >= 0) & (ix < width) & (iy >= 0) & (iy < height)
+        np.maximum.at(buffer, (iy[inside], ix[inside]), coverage[inside])
+    return buffer
+
+
+def add_points(ax, x, y, radius, color='black', alpha=1.0, zorder=0):
+    """Draw points given in data coordinates as one raster layer of ``ax``.
+
+    ``radius`` is in points, like the size of a marker.  Returns the
+    ``AxesImage``, which is clipped to the axes patch.
+
+    """
+    ax.apply_aspect()
+    bbox = ax.get_window_extent()
+    width = max(int(round(bbox.width)), 1)
+    height = max(int(round(bbox.height)), 1)
+
+    xy = ax.transData.transform(np.column_stack([x, y]))
+    px = (xy[:, 0] - bbox.x0) * width / bbox.width
+    py = (xy[:, 1] - bbox.y0) * height / bbox.height
+    radius = np.asarray(radius, dtype=float) * ax.figure.dpi / 72.0
+
+    rgba = np.empty((height, width, 4), dtype=np.uint8)
+    rgba[..., :3] = np.round(np.array(to_rgb(color)) * 255)
+    rgba[..., 3] = np.round(alpha * 255 * splat((height, width), px, py, radius))
+
+    image = AxesImage(ax, interpolation='nearest', origin='lower',
+                      extent=(0, 1, 0, 1), transform=ax.transAxes, zorder=zorder)
+    image.set_data(rgba)
+    ax.add_image(image)
+    return image
@@ -0,0 +1,65 @@
+"""Skip rendering outputs whose inputs did not change.
+
+Every output gets a digest of everything that decides how it looks: a
+JSON spec of its parameters (target, epoch, field, limits, style) and
+the arrays it draws, so a changed catalog changes the digest too.  The
+digests of the outputs of a directory are kept in a manifest, and an
+output whose digest matches the manifest, and whose file still exists,
+is not rendered again.
+
+The manifests live in the catalog cache (see ``catalog_cache``), one per
+output directory, rather than among the outputs, where they would show
+up as untracked files in a checkout such as the ``images`` of the
+finder charts.
+
+The manifest is only read and written by the parent process: workers
+compute digests and report them back, see ``render_batch``.
+
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import catalog_cache
+
+
+def manifest_path(directory, name='manifest.json'):
+    """Return where the manifest of the outputs in ``directory`` is kept."""
+    key = hashlib.sha1(os.path.abspath(directory).encode()).hexdigest()[:16]
+    return os.path.join(catalog_cache.cache_dir(), 'render', f'{key}-{name}')
+
+
+class RenderCache:
+    """The manifest of rendered outputs in ``directory``."""
+
+    def __init__(self, directory, name='manifest.json'):
+        self.path = manifest_path(directory, name)
+        try:
+            with open(self.path) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def digest(self, spec, arrays=None):
+        """Return the hex digest of a JSON-able ``spec`` and a dict of arrays."""
+        h = hashlib.sha1(json.dumps(spec, sort_keys=True).encode())
+        for name in sorted(arrays or {}):
+            h.update(name.encode())
+            h.update(np.ascontiguousarray(arrays[name]).tobytes())
+        return h.hexdigest()
+
+    def fresh(self, key, digest, filename):
+        """Whether ``filename`` was rendered from the same inputs."""
+        return self.manifest.get(key) == digest and os.path.exists(filename)
+
+    def record(self, key, digest):
+        self.manifest[key] = digest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=0, sort_keys=True)
+        os.replace(tmp, self.path)
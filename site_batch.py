@@ -0,0 +1,168 @@
+"""Render the all-sky chart of starmap.py for many sites at one epoch.
+
+For a single epoch the astrometric places of the stars, DSOs,
+constellation borders and planets are the same from every site on the
+Earth, to well within a marker: the diurnal aberration and the parallax
+of even the nearest star are a fraction of an arcsecond.  So they are
+observed once, from the center of the Earth, by a ``starmap.ZenithSky``
+that holds every star bright enough to plot anywhere.  Each site then
+only needs the matrix of ``rotation_at``, whose last row is its zenith,
+to project the cached vectors around that zenith and to find their
+altitudes, and its position for the parallax of the Moon.  The charts
+are drawn by ``starmap.render_chart``, labels and all, so they look
+exactly like the chart of starmap.py.
+
+The charts are rendered by worker processes through ``render_batch``,
+which share the observed vectors with the parent.  The sites are read
+from a CSV file with the columns ``name``, ``latitude`` and
+``longitude`` in degrees, north and east positive, and optionally
+``elevation_m``.
+
+"""
+import argparse
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from skyfield.api import load, wgs84, utc, N, E
+
+import catalog_cache
+import constellation_bounds
+import constellation_centers
+import constellation_figures
+import dsos
+import horizon
+import starmap
+from batch_render import render_batch
+from solar_system import SolarSystem
+
+
+def load_sites(path):
+    """Return the ``(name, wgs84 position)`` pairs of a CSV file of sites."""
+    try:
+        from pandas import read_csv
+    except ImportError:
+        raise ImportError("NO PANDAS NO CANDO")
+
+    df = read_csv(path, skipinitialspace=True)
+    elevation = df['elevation_m'] if 'elevation_m' in df else np.zeros(len(df))
+    return [(name, wgs84.latlon(latitude, longitude, elevation_m=elevation_m))
+            for name, latitude, longitude, elevation_m
+            in zip(df['name'], df['latitude'], df['longitude'], elevation)]
+
+
+def site_filename(pattern, name):
+    """Fill ``pattern`` with a form of ``name`` that is safe as a filename."""
+    return pattern.format(re.sub(r'[^\w-]+', '_', name).strip('_'))
+
+
+class SiteBatch:
+    """The charts of many sites at one epoch, drawn from one ``ZenithSky``.
+
+    ``sky`` should be built without a center, so that it holds the stars
+    of every site.  ``refraction`` and ``extinction`` are passed on to
+    ``ZenithSky.layers``.
+
+    """
+    def __init__(self, sky, sites, refraction=False, extinction=None):
+        self.sky = sky
+        self.names = [name for name, site in sites]
+        self.refraction = refraction
+        self.extinction = extinction
+
+        # One rotation matrix and one geocentric position per site.
+
+        self.rotations = np.array([site.rotation_at(sky.t) for name, site in sites])
+        self.positions = np.array([site.at(sky.t).xyz.au for name, site in sites])
+        self.chart = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def zenith(self, i):
+        return self.rotations[i][2]
+
+    def layers(self, i):
+        """Return the layers of site ``i``, see ``ZenithSky.layers``."""
+        return self.sky.layers(self.rotations[i], self.positions[i],
+                               refraction=self.refraction, extinction=self.extinction)
+
+    def render(self, i, pattern='sites/{}.png'):
+        """Render the chart of site ``i`` and return its filename."""
+        if self.chart is None:
+            self.chart = starmap.chart_template()
+        title = f"{self.names[i]} on {self.sky.t.utc_strftime('%Y %B %d %H:%M')} UTC"
+        filename = site_filename(pattern, self.names[i])
+        starmap.render_chart(self.chart, self.layers(i), title, filename)
+        return filename
+
+
+# The batch being rendered and its filename pattern, for the forked
+# workers.
+
+_batch = None
+_pattern = None
+
+
+def _render_site(i):
+    return _batch.render(i, _pattern)
+
+
+def render_sites(batch, pattern='sites/{}.png', processes=None):
+    """Render the chart of every site of ``batch``; yields the filenames in order."""
+    global _batch, _pattern
+    os.makedirs(os.path.dirname(pattern) or '.', exist_ok=True)
+    _batch, _pattern = batch, pattern
+    try:
+        yield from render_batch(_render_site, range(len(batch)), processes)
+    finally:
+        _batch = _pattern = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the all-sky chart for many sites at once.')
+    parser.add_argument('--sites', help='CSV file with the columns name, latitude, longitude'
+                        ' and optionally elevation_m (default: Amsterdam only)')
+    parser.add_argument('--utc', default='1976-10-17T04:25',
+                        help='epoch of the charts in UTC (default: %(default)s)')
+    parser.add_argument('--output', default='sites/{}.png',
+                        help='filename pattern, filled with the site name')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    parser.add_argument('--limiting-magnitude', type=float, default=6.0)
+    parser.add_argument('--refraction', action='store_true',
+                        help='show the objects at their refracted altitudes')
+    parser.add_argument('--extinction', type=float, nargs='?',
+                        const=horizon.EXTINCTION_COEFFICIENT,
+                        help='dim the objects by this many magnitudes per airmass'
+                             ' (default when given: %(const)s)')
+    args = parser.parse_args()
+
+    ts = load.timescale()
+    t = ts.from_datetime(datetime.fromisoformat(args.utc).replace(tzinfo=utc))
+
+    if args.sites:
+        sites = load_sites(args.sites)
+    else:
+        sites = [('Amsterdam', wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28))]
+
+    eph = load('de421.bsp')
+    solar_system = SolarSystem(eph)
+
+    stardata = catalog_cache.load_hipparcos()
+    dsodata = dsos.load_catalog('data/catalog.txt')
+    constdata = constellation_bounds.load_boundaries()
+    with open('data/centers_18.txt') as fc:
+        centersdata = constellation_centers.load_dataframe(fc)
+    figures = constellation_figures.load('western_SnT', stardata)
+    starnames = dict(catalog_cache.load_star_names('western_SnT'))
+
+    sky = starmap.ZenithSky(eph['earth'], t, None, stardata, dsodata, constdata,
+                            centersdata, figures, starnames, solar_system,
+                            limiting_magnitude=args.limiting_magnitude)
+    batch = SiteBatch(sky, sites, refraction=args.refraction, extinction=args.extinction)
+    for filename in render_sites(batch, args.output, args.processes):
+        print(filename)
@@ -0,0 +1,85 @@
+import numpy as np
+
+from projection_engine import center_vector
+
+
+class SkyIndex:
+    """Cone and magnitude lookups over the RA/Dec columns of a catalog.
+
+    The catalog is split into magnitude bands of ``band_width`` and the
+    stars of every band are sorted by declination, so a query only has
+    to look at the bands brighter than the limit and, inside each band,
+    at the declination strip that the cone touches.  The index works on
+    catalog positions, so pad the radius a little if the field edge
+    matters to a fraction of a degree.
+
+    Queries return sorted integer positions into the catalog, ready for
+    ``data.iloc[...]`` or for indexing NumPy columns.
+
+    """
+    def __init__(self, data, band_width=1.0):
+        ra = np.radians(data['ra_degrees'].values)
+        dec = np.radians(data['dec_degrees'].values)
+        magnitude = data['magnitude'].values
+
+        # Stars without a magnitude go into a final band that no limit
+        # ever reaches.
+
+        band = np.floor(magnitude / band_width)
+        band[np.isnan(band)] = np.inf
+
+        order = np.lexsort((dec, band))
+        self.order = order
+        self.band_width = band_width
+        self.magnitude = magnitude[order]
+        self.dec = dec[order]
+        self.unit = np.array([
+            np.cos(dec) * np.cos(ra),
+            np.cos(dec) * np.sin(ra),
+            np.sin(dec),
+        ])[:, order]
+
+        self.bands, self.band_start = np.unique(band[order], return_index=True)
+        self.band_stop = np.append(self.band_start[1:], len(order))
+
+    def __len__(self):
+        return len(self.order)
+
+    def brighter_than(self, limiting_magnitude):
+        """Return the positions of all stars at or above the limit."""
+        return self.query(None, 180.0, limiting_magnitude)
+
+    def query(self, center, radius_degrees, limiting_magnitude=None):
+        """Return the positions of the stars in a cone around ``center``.
+
+        ``center`` is a skyfield position or a 3-vector.  A radius of
+        180 degrees or more selects the whole sky and only filters on
+        magnitude.
+
+        """
+        radius = np.radians(radius_degrees)
+        whole_sky = center is None or radius >= np.pi
+        if not whole_sky:
+            c = center_vector(center)
+            center_dec = np.arcsin(np.clip(c[2], -1.0, 1.0))
+            cos_radius = np.cos(radius)
+
+        found = []
+        for band, start, stop in zip(self.bands, self.band_start, self.band_stop):
+            if limiting_magnitude is not None:
+                if band * self.band_width > limiting_magnitude:
+                    break
+            if not whole_sky:
+                dec = self.dec[start:stop]
+                start, stop = start + np.searchsorted(
+                    dec, [center_dec - radius, center_dec + radius])
+            selected = np.arange(start, stop)
+            if not whole_sky:
+                selected = selected[c @ self.unit[:, start:stop] >= cos_radius]
+            if limiting_magnitude is not None:
+                selected = selected[self.magnitude[selected] <= limiting_magnitude]
+            found.append(self.order[selected])
+
+        if not found:
+            return np.empty(0, dtype=int)
+        return np.sort(np.concatenate(found))
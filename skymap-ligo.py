@@ -5,6 +5,7 @@ from skyfield.data import hipparcos, mpc, stellarium
 import dsos
 import constellation_bounds
 import constellation_centers
+from sky_index import SkyIndex
 from datetime import datetime
 from pytz import timezone
 
@@ -50,19 +51,22 @@ planets = {name: eph[id] for name, id in planet_names.items()}
 with load.open(hipparcos.URL) as f:
     stardata = hipparcos.load_dataframe(f)
 
-star_positions = earth.at(t).observe(Star.from_dataframe(stardata))
-
-# Create a True/False mask marking the stars bright enough to be
-# included in our plot.  And go ahead and compute how large their
+# Look up the stars bright enough to be included in our plot, so that
+# only those need astrometry.  And go ahead and compute how large their
 # markers will be on the plot.
 
 limiting_magnitude = 6.0
-bright_stars = (stardata.magnitude <= limiting_magnitude)
-magnitude = stardata['magnitude'][bright_stars]
+star_index = SkyIndex(stardata)
+bright_stars = star_index.brighter_than(limiting_magnitude)
+brightdata = stardata.iloc[bright_stars]
+
+star_positions = earth.at(t).observe(Star.from_dataframe(brightdata))
+
+magnitude = brightdata['magnitude']
 marker_size = (0.7 + limiting_magnitude - magnitude) ** 2.0
 
-ra = stardata['ra_hours'][bright_stars]
-dec = stardata['dec_degrees'][bright_stars]
+ra = brightdata['ra_hours']
+dec = brightdata['dec_degrees']
 
 time = Time.now()
 coos = SkyCoord(ra, dec, frame='icrs', unit=(u.hourangle, u.deg), obstime=time)
@@ -79,7 +83,7 @@ ax.compass(1,1,0.1)
 ax.scatter(ra, dec,
            s=marker_size+5, color='black')
 
-ax.scatter(stardata['ra_degrees'][bright_stars], stardata['dec_degrees'][bright_stars],
+ax.scatter(brightdata['ra_degrees'], brightdata['dec_degrees'],
            s=marker_size, color='black', alpha=0.75)
 
 plt.show()
\ No newline at end of file
@@ -0,0 +1,128 @@
+"""The planets and the Moon as one layer of the charts.
+
+The Earth's barycentric state is computed once per epoch, or once for a
+whole Time array, and every body is observed from that same position.
+Alongside the apparent direction each body gets its visual magnitude
+and illuminated fraction, so the markers can be sized like the stars.
+
+"""
+import numpy as np
+from skyfield.functions import angle_between, length_of
+from skyfield.magnitudelib import planetary_magnitude
+
+from projection_engine import project_vectors, unit_vectors
+
+PLANET_NAMES = {
+    'mercury': 199,
+    'venus': 299,
+    'mars': 499,
+    'jupiter': 5,
+    'saturn': 6,
+    'uranus': 7,
+    'neptune': 8,
+    'pluto': 9,
+    'moon': 301
+}
+
+PLANET_DTYPE = np.dtype([
+    ('name', 'U16'),
+    ('x', 'f8'),
+    ('y', 'f8'),
+    ('magnitude', 'f8'),
+    ('phase', 'f8'),
+])
+
+MOON_MEAN_DISTANCE_AU = 0.00257
+
+
+def moon_magnitude(delta, ph_ang):
+    """Visual magnitude of the Moon from its distance and phase angle."""
+    return (-12.73 + 0.026 * ph_ang + 4e-9 * ph_ang**4
+            + 5.0 * np.log10(delta / MOON_MEAN_DISTANCE_AU))
+
+
+def pluto_magnitude(r, delta):
+    """Visual magnitude of Pluto, ignoring its small phase effect."""
+    return -1.0 + 5.0 * np.log10(r * delta)
+
+
+def marker_size(magnitude, limiting_magnitude, brightest=-4.0):
+    """Marker areas on the same scale as the stars of the charts.
+
+    Anything brighter than ``brightest`` gets the same marker, so the
+    Moon and Venus do not swamp the chart, and a body without a known
+    magnitude is drawn as if it were at the limit.
+
+    """
+    magnitude = np.clip(magnitude, brightest, limiting_magnitude)
+    magnitude = np.where(np.isnan(magnitude), limiting_magnitude, magnitude)
+    return (0.7 + limiting_magnitude - magnitude) ** 2.0
+
+
+class SolarSystem:
+    """The bodies of an ephemeris, observed together from the Earth."""
+
+    def __init__(self, eph, names=PLANET_NAMES):
+        self.sun = eph['sun']
+        self.earth = eph['earth']
+        self.names = list(names)
+        self.bodies = [eph[code] for code in names.values()]
+
+    def __len__(self):
+        return len(self.names)
+
+    def observe(self, t):
+        """Observe every body at ``t``, a single Time or a Time array.
+
+        Returns ``(unit, magnitude, phase)``: the apparent directions as
+        (3, bodies) unit vectors, and the magnitudes and illuminated
+        fractions as (bodies,) arrays.  With a Time array every result
+        gets an extra trailing axis for the epochs.
+
+        """
+        observer = self.earth.at(t)
+        sun = self.sun.at(t).xyz.au
+        earth = observer.xyz.au
+
+        shape = (len(self),) + np.shape(t.tt)
+        unit = np.empty((3,) + shape)
+        magnitude = np.empty(shape)
+        phase = np.empty(shape)
+
+        for i, body in enumerate(self.bodies):
+            astrometric = observer.observe(body)
+            unit[:, i] = unit_vectors(astrometric)
+
+            observer_to_body = astrometric.xyz.au
+            sun_to_body = earth + observer_to_body - sun
+            r = length_of(sun_to_body)
+            delta = length_of(observer_to_body)
+            ph_ang = np.degrees(angle_between(sun_to_body, observer_to_body))
+            phase[i] = (1.0 + np.cos(np.radians(ph_ang))) / 2.0
+
+            try:
+                magnitude[i] = planetary_magnitude(astrometric)
+            except ValueError:
+                if self.names[i] == 'moon':
+                    magnitude[i] = moon_magnitude(delta, ph_ang)
+                elif self.names[i] == 'pluto':
+                    magnitude[i] = pluto_magnitude(r, delta)
+                else:
+                    magnitude[i] = np.nan
+
+        return unit, magnitude, phase
+
+    def table(self, t, center):
+        """Return the bodies at a single epoch ``t`` as a ``PLANET_DTYPE`` array.
+
+        The *x* and *y* are the stereographic coordinates around
+        ``center``, a skyfield position or a unit 3-vector.
+
+        """
+        unit, magnitude, phase = self.observe(t)
+        table = np.empty(len(self), dtype=PLANET_DTYPE)
+        table['name'] = self.names
+        table['x'], table['y'] = project_vectors(center, unit)
+        table['magnitude'] = magnitude
+        table['phase'] = phase
+        return table
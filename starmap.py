@@ -1,261 +1,380 @@
+"""Chart the sky above Amsterdam, centered on the zenith.
+
+The chart is built in steps that other scripts import: ``ZenithSky``
+observes every layer of the chart for an epoch, ``ZenithSky.layers``
+projects the layers around the zenith of a site and drops whatever is
+below its horizon, ``chart_template`` builds the figure and
+``render_chart`` draws the layers and their labels and saves the chart.
+The steps take a ``stage`` hook, which benchmark.py uses to time them.
+
+"""
+import argparse
+import os
 import numpy as np
-import pandas as pd
-from matplotlib import pyplot as plt
-from matplotlib.collections import LineCollection, PolyCollection
 
-
-from skyfield.api import Star, load, wgs84, N, S, W, E
-from skyfield.data import hipparcos, mpc, stellarium
+from skyfield.api import load, wgs84, N, E
+from skyfield.functions import length_of
 import dsos
+import catalog_cache
 import constellation_bounds
 import constellation_centers
-from skyfield.projections import build_stereographic_projection
+import constellation_figures
+import horizon
+from chart_template import ChartTemplate
+from dense_catalog import DenseCatalog
+from sky_index import SkyIndex
+from projection_engine import ProjectionEngine, SkyTable, project_vectors
+from labels import Labeller
+from starmap_utils import get_limit, no_stage
+from solar_system import SolarSystem, marker_size as planet_marker_size
 from datetime import datetime
 from pytz import timezone
 
-# time `t` we use for everything else.
-
-AMS = timezone('Europe/Amsterdam')
-ts = load.timescale()
-t = ts.from_datetime(AMS.localize(datetime(1976, 10, 17, 5, 25, 0)))
-# 180 = South 0 = North
-degrees = 0.0
-
-
-amsterdam = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28).at(t)
-position = amsterdam.from_altaz(alt_degrees=90, az_degrees=degrees)
-
-# An ephemeris from the JPL provides Sun and Earth positions.
-
-eph = load('de421.bsp')
-sun = eph['sun']
-earth = eph['earth']
-planet_names = {
-    'mercury': 199,
-    'venus': 299,
-    'mars': 499,
-    'jupiter': 5,
-    'saturn': 6,
-    'uranus': 7,
-    'neptune': 8,
-    'pluto': 9,
-    'moon': 301
-}
-planets = {name: eph[id] for name, id in planet_names.items()}
-
-# The Hipparcos mission provides our star catalog.
-
-with load.open(hipparcos.URL) as f:
-    stardata = hipparcos.load_dataframe(f)
-
-# DSO's from stellarium
-
-with open('data/catalog.txt') as f:
-    dsodata = dsos.load_dataframe(f)
-
-with open('data/lines_in_18.txt') as fc:
-    constdata = constellation_bounds.load_dataframe(fc)
-
-with open('data/centers_18.txt') as fc:
-    centersdata = constellation_centers.load_dataframe(fc)
-
-# And the constellation outlines come from Stellarium.  We make a list
-# of the stars at which each edge stars, and the star at which each edge
-# ends.
-
-url = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
-       '/skycultures/western_SnT/constellationship.fab')
-
-with load.open(url) as f:
-    consdata = stellarium.parse_constellations(f)
-
-url2 = ('https://raw.githubusercontent.com/Stellarium/stellarium/master'
-       '/skycultures/western_SnT/star_names.fab')
-
-with load.open(url2) as f2:
-    star_names = stellarium.parse_star_names(f2)
-    starnames = {hip: name for hip, name in star_names}
-
-
-
-def generate_constellation_lines(data, polygon=False):
-    edges = [edge for name, edges in data for edge in edges]
-    edges_star1 = [star1 for star1, star2 in edges]
-    edges_star2 = [star2 for star1, star2 in edges]
-    xy1 = stardata[['x', 'y']].loc[edges_star1].values
-    xy2 = stardata[['x', 'y']].loc[edges_star2].values
-
-    if polygon:
-        return [xy1]
-    else:
-
-        # The constellation lines will each begin at the x,y of one star and end
-        # at the x,y of another.  We have to "rollaxis" the resulting coordinate
-        # array into the shape that matplotlib expects.
-
-        return np.rollaxis(np.array([xy1, xy2]), 1)
-
-def generate_constellation_borders(data):
-    xy1 = pd.DataFrame(columns=['x', 'y'])
-    xy2 = pd.DataFrame(columns=['x', 'y'])
-    for segm, line in data:
-        p1 = []
-        p2 = []
-        for i, point in enumerate(line.iterrows()):
-            if i == 0:
-                p1 = [point[1]['x'], point[1]['y']]
-            else:
-                p2 = [point[1]['x'], point[1]['y']]
-                xy1.loc[len(xy2)] = p1
-                xy2.loc[len(xy2)] = p2
-                p1 = p2
-
-    return np.rollaxis(np.array([xy1, xy2]), 1)
-
-# We will center the chart on the comet's middle position.
-
-projection = build_stereographic_projection(position)
-field_of_view_degrees = 180.0
-limiting_magnitude = 6.0
-dso_limit_magnitude = 8.0
-
-# Now that we have constructed our projection, compute the x and y
-# coordinates that each star will have on the plot.
-
-planetdata = pd.DataFrame(columns=['x', 'y', 'name'])
-for name, obj in planets.items():
-    x, y = projection(earth.at(t).observe(obj))
-    planetdata.loc[len(planetdata)] = [x, y, name]
-
-star_positions = earth.at(t).observe(Star.from_dataframe(stardata))
-stardata['x'], stardata['y'] = projection(star_positions)
-
-dso_positions = earth.at(t).observe(Star.from_dataframe(dsodata))
-dsodata['x'], dsodata['y'] = projection(dso_positions)
-
-cons_borders = earth.at(t).observe(Star.from_dataframe(constdata))
-constdata['x'], constdata['y'] = projection(cons_borders)
-constsegments = constdata.groupby('segment')
-
-cons_centers = earth.at(t).observe(Star.from_dataframe(centersdata))
-centersdata['x'], centersdata['y'] = projection(cons_centers)
-
-# Create a True/False mask marking the stars bright enough to be
-# included in our plot.  And go ahead and compute how large their
-# markers will be on the plot.
-
-bright_stars = (stardata.magnitude <= limiting_magnitude)
-magnitude = stardata['magnitude'][bright_stars]
-marker_size = (0.7 + limiting_magnitude - magnitude) ** 2.0
-
-bright_dsos = (dsodata.magnitude <= dso_limit_magnitude)
-dso_magnitude = dsodata['magnitude'][bright_dsos]
-dso_size = (0.9 + dso_limit_magnitude - dso_magnitude) ** 2.0
-
-# Time to build the figure!
-
-fig, ax = plt.subplots(figsize=[24, 24])
-
-# Draw Horizon as dashed line
-# 24 points horizon
-
-border = plt.Circle((0, 0), 1, color='navy', zorder=-2, fill=True)
-ax.add_patch(border)
-
-# The horizon the hard way
-# you can just draw a circle
-# horizon = plt.Circle((0, 0), radius=1, transform=ax.transData)
-#horizon = []
-#h0 = projection(amsterdam.from_altaz(alt_degrees=0, az_degrees=0.0))
-#for i in range(1, 73):
-#    delta = 5.0
-#    current = i * delta
-#    h1 = projection(amsterdam.from_altaz(alt_degrees=0, az_degrees=current))
-#    horizon.append([h0, h1])
-#    h0 = h1
-#
-#ax.add_collection(LineCollection(horizon,
-#                         colors='#00f2', linewidths=1, linestyle='dashed', zorder=-1, alpha=0.5))
-
-# Draw the constellation lines.
-
-constellations = LineCollection(generate_constellation_lines(consdata),
-                                colors='grey', linewidths=1, zorder=-1, alpha=0.5)
-ax.add_collection(constellations)
-
-# Draw constellation borders.
-borders = LineCollection(generate_constellation_borders(constsegments),
-                                colors='black', linewidths=1, zorder=-1, alpha=0.5, linestyles='dashed')
-ax.add_collection(borders)
-
-
-# Draw the stars.
-
-ax.scatter(stardata['x'][bright_stars], stardata['y'][bright_stars],
-           s=marker_size+5, color='black')
-
-ax.scatter(stardata['x'][bright_stars], stardata['y'][bright_stars],
-           s=marker_size, color='white', alpha=0.75)
-
-ax.scatter(planetdata['x'], planetdata['y'],
-           s=25, color='green', alpha=0.65)
-
-ax.scatter(dsodata['x'][bright_dsos], dsodata['y'][bright_dsos],
-           s=dso_size, color='red')
-
-# Finally, title the plot and set some final parameters.
-
-angle = np.pi - field_of_view_degrees / 360.0 * np.pi
-limit = np.sin(angle) / (1.0 - np.cos(angle))
-
-
-for i, s in stardata[bright_stars].iterrows():
-    if -limit < s['x'] < limit and -limit < s['y'] < limit:
-        if i in starnames:
-            print(f"star {starnames[i]} mag {s['magnitude']}")
-            ax.text(s['x'] + 0.004, s['y'] - 0.004, starnames[i], color='white',
-                    ha='left', va='top', fontsize=5, weight='bold', zorder=1).set_alpha(0.5)
-
-for i, p in planetdata.iterrows():
-    if -limit < p['x'] < limit and -limit < p['y'] < limit:
-        ax.text(p['x'] + 0.004, p['y'] - 0.004, p['name'], color='green',
-                ha='left', va='top', fontsize=10, weight='bold', zorder=1).set_alpha(0.5)
-
-for i, d in dsodata[bright_dsos].iterrows():
-    if -limit < d['x'] < limit and -limit < d['y'] < limit:
-        # print(f"dso {d['label']} mag {d['magnitude']}")
-        ax.text(d['x'] + 0.004, d['y'] - 0.004, d['label'], color='red',
-                ha='left', va='top', fontsize=8, weight='bold', zorder=1).set_alpha(0.5)
-
-for i, c in centersdata.iterrows():
-    if -limit < c['x'] < limit and -limit < c['y'] < limit:
-        ax.text(c['x'], c['y'], i, color='white',
-                ha='center', va='center', fontsize=35, weight='bold', zorder=1).set_alpha(0.20)
-
-ax.set_xlim(-limit, limit)
-ax.set_ylim(-limit, limit)
-ax.xaxis.set_visible(True)
-ax.yaxis.set_visible(True)
-ax.set_aspect(1.0)
-
-font = {
-    'fontsize': 'large',
-    'fontweight': 'normal',
-    'color': 'black',
-    'verticalalignment': 'baseline',
-    'horizontalalignment': 'center'
-}
-
-ax.set_title(f"To the South in Amsterdam on {t.utc_strftime('%Y %B %d %H:%M')} UTC", fontdict=font)
-
-# clip at the horizon
-horizon = plt.Circle((0, 0), radius=1, transform=ax.transData)
-for col in ax.collections:
-    col.set_clip_path(horizon)
-# Save.
 
-plt.axis('off')
-#plt.show()
-
-fig.savefig('starmap.png', bbox_inches='tight')
-#            , transparent=True, facecolor='#041A40')
\ No newline at end of file
+class ZenithSky:
+    """Every layer of the zenith chart, observed once for the epoch ``t``.
+
+    Only the stars within ``field_of_view_degrees / 2`` of ``center``
+    that are bright enough to plot, and the stars of the constellation
+    figures, are observed.  ``field`` is a dataframe of dense-catalog
+    stars to plot instead of the Hipparcos ones, which then still
+    provide the figures and the names.
+
+    Everything is observed from the center of the Earth.  For one epoch
+    those places hold for every site to well within a marker, except for
+    the Moon, whose direction ``layers`` corrects for the parallax of the
+    site.  With ``center`` None all the stars bright enough to plot are
+    observed, so that the same sky serves the charts of many sites, see
+    site_batch.py.
+
+    """
+    def __init__(self, earth, t, center, stardata, dsodata, constdata, centersdata,
+                 figures, starnames, solar_system, field=None, field_of_view_degrees=180.0,
+                 limiting_magnitude=6.0, dso_limit_magnitude=8.0):
+        self.t = t
+        self.stardata = stardata
+        self.figures = figures
+        self.field = field
+        self.limiting_magnitude = limiting_magnitude
+        self.dso_limit_magnitude = dso_limit_magnitude
+
+        # Only the stars above the horizon that are bright enough to plot, and
+        # the stars of the constellation figures, need astrometry at all.
+
+        if center is None:
+            self.visible = np.arange(catalog_cache.brighter_than(stardata, limiting_magnitude))
+        else:
+            star_index = SkyIndex(stardata)
+            self.visible = star_index.query(center, field_of_view_degrees / 2.0 + 1.0,
+                                            limiting_magnitude)
+        self.observed = np.union1d(self.visible, figures.stars)
+        self.named = stardata.index.isin(list(starnames))
+        self.starnames = starnames
+
+        # The DSO catalog is sorted by magnitude, so the ones bright enough to
+        # plot are a leading slice and only those need astrometry.
+
+        self.dsodata = dsodata.iloc[:catalog_cache.brighter_than(dsodata, dso_limit_magnitude)]
+        self.centersdata = centersdata
+
+        # Every fixed-position layer goes into one table that is observed and
+        # projected in a single pass, and each layer takes its block of rows.
+
+        layers = {
+            'stars': stardata.iloc[self.observed],
+            'dsos': self.dsodata,
+            'borders': constdata,
+            'centers': centersdata,
+        }
+        if field is not None:
+            layers['field'] = field
+        self.sky = SkyTable(layers)
+        self.engine = ProjectionEngine(earth.at(t), self.sky.columns)
+        self.border1, self.border2 = constellation_bounds.border_pairs(constdata)
+
+        self.planet_names = np.array(solar_system.names)
+        self.planets, self.planet_magnitude, self.planet_phase = solar_system.observe(t)
+
+        # The apparent geocentric place of the Moon in au, from which the
+        # position of a site is subtracted for its parallax of up to a
+        # degree.
+
+        self.moon = None
+        if 'moon' in solar_system.names:
+            self.moon = solar_system.names.index('moon')
+            moon = solar_system.bodies[self.moon]
+            self.moon_au = earth.at(t).observe(moon).apparent().xyz.au
+
+    def planets_from(self, position):
+        """Return the (3, bodies) directions of the planets seen from ``position``.
+
+        ``position`` is the geocentric position of a site in au, as
+        ``site.at(t).xyz.au``.
+
+        """
+        planets = self.planets
+        if self.moon is not None:
+            planets = planets.copy()
+            moon = self.moon_au - position
+            planets[:, self.moon] = moon / length_of(moon)
+        return planets
+
+    def layers(self, rotation, position=None, refraction=False, extinction=None):
+        """Return the layers above the horizon of a site as a dict of arrays.
+
+        ``rotation`` is the matrix of ``site.rotation_at(t)``.  Its last
+        row is the zenith, the center of the chart, and the same matrix
+        gives the altitude of every object.  ``position`` is the
+        geocentric position of the site in au, for the parallax of the
+        Moon.  With ``refraction`` the objects are shown at their
+        refracted altitudes, and with an ``extinction`` coefficient they
+        are dimmed by that many magnitudes per airmass before the
+        limiting magnitudes apply.
+
+        """
+        sky = self.sky
+        center = rotation[2]
+        x, y = self.engine.project(center)
+        alt, az = horizon.rotated_altaz(rotation, self.engine.unit)
+        planets = self.planets if position is None else self.planets_from(position)
+        planet_x, planet_y = project_vectors(center, planets)
+        planet_alt = horizon.rotated_altaz(rotation, planets)[0]
+        if refraction:
+            x, y, alt = horizon.zenith_refraction(x, y, alt)
+            planet_x, planet_y, planet_alt = horizon.zenith_refraction(
+                planet_x, planet_y, planet_alt)
+        above = alt > 0.0
+
+        # Near the horizon the air dims everything, so the limiting magnitude
+        # holds for the dimmed magnitudes.
+
+        dimming = np.zeros(len(sky))
+        planet_dimming = np.zeros(len(self.planet_names))
+        if extinction is not None:
+            dimming = horizon.extinction(alt, extinction)
+            planet_dimming = horizon.extinction(planet_alt, extinction)
+
+        # The figures are compiled against the positions in stardata, so
+        # the observed stars are spread back over the whole catalog.
+
+        star_x = np.full(len(self.stardata), np.nan)
+        star_y = np.full(len(self.stardata), np.nan)
+        star_above = np.zeros(len(self.stardata), dtype=bool)
+        star_dimming = np.zeros(len(self.stardata))
+        star_x[self.observed] = sky.view(x, 'stars')
+        star_y[self.observed] = sky.view(y, 'stars')
+        star_above[self.observed] = sky.view(above, 'stars')
+        star_dimming[self.observed] = sky.view(dimming, 'stars')
+
+        # Only the figure lines and border lines with an end above the
+        # horizon are drawn; the horizon clips the rest of those.
+
+        figures = self.figures
+        lines = figures.segments(star_x, star_y)
+        lines = lines[star_above[figures.star1] | star_above[figures.star2]]
+
+        border_xy = np.column_stack([sky.view(x, 'borders'), sky.view(y, 'borders')])
+        border_above = sky.view(above, 'borders')
+        keep = border_above[self.border1] | border_above[self.border2]
+        borders = np.stack([border_xy[self.border1[keep]], border_xy[self.border2[keep]]],
+                           axis=1)
+
+        # The stars above the horizon that are bright enough to be included
+        # in our plot, and how large their markers will be.
+
+        limiting_magnitude = self.limiting_magnitude
+        magnitude = self.stardata['magnitude'].values
+        visible = self.visible[star_above[self.visible]
+                               & (magnitude[self.visible] + star_dimming[self.visible]
+                                  <= limiting_magnitude)]
+        if self.field is not None:
+            field_magnitude = self.field['magnitude'].values + sky.view(dimming, 'field')
+            visible_field = sky.view(above, 'field') & (field_magnitude <= limiting_magnitude)
+            stars = np.column_stack([sky.view(x, 'field')[visible_field],
+                                     sky.view(y, 'field')[visible_field]])
+            star_magnitude = field_magnitude[visible_field]
+        else:
+            stars = np.column_stack([star_x[visible], star_y[visible]])
+            star_magnitude = magnitude[visible] + star_dimming[visible]
+        named = visible[self.named[visible]]
+
+        dso_magnitude = self.dsodata['magnitude'].values + sky.view(dimming, 'dsos')
+        visible_dsos = sky.view(above, 'dsos') & (dso_magnitude <= self.dso_limit_magnitude)
+        dso_magnitude = dso_magnitude[visible_dsos]
+
+        visible_centers = sky.view(above, 'centers')
+        visible_planets = planet_alt > 0.0
+        planet_magnitude = self.planet_magnitude + planet_dimming
+
+        return {
+            'stars': stars,
+            'star_size': (0.7 + limiting_magnitude - star_magnitude) ** 2.0,
+            'lines': lines,
+            'borders': borders,
+            'named': np.column_stack([star_x[named], star_y[named]]),
+            'named_label': self.stardata.index[named].map(self.starnames).values,
+            'named_magnitude': magnitude[named],
+            'dsos': np.column_stack([sky.view(x, 'dsos')[visible_dsos],
+                                     sky.view(y, 'dsos')[visible_dsos]]),
+            'dso_size': (0.9 + self.dso_limit_magnitude - dso_magnitude) ** 2.0,
+            'dso_label': self.dsodata['label'].values[visible_dsos],
+            'dso_magnitude': dso_magnitude,
+            'centers': np.column_stack([sky.view(x, 'centers')[visible_centers],
+                                        sky.view(y, 'centers')[visible_centers]]),
+            'center_label': self.centersdata.index.values[visible_centers],
+            'planets': np.column_stack([planet_x[visible_planets], planet_y[visible_planets]]),
+            'planet_size': planet_marker_size(planet_magnitude[visible_planets],
+                                              limiting_magnitude),
+            'planet_label': self.planet_names[visible_planets],
+        }
+
+
+# The output formats in which the labels are kept as text.
+
+VECTOR_FORMATS = ('.pdf', '.svg', '.eps', '.ps')
+
+
+def chart_template(field_of_view_degrees=180.0, size=24, dpi=100):
+    """Build the figure of the zenith chart, whose layers ``render_chart`` sets."""
+    chart = ChartTemplate(get_limit(field_of_view_degrees), figsize=[size, size], dpi=dpi)
+
+    # The horizon disk; every layer is clipped to it.
+
+    chart.add_horizon()
+    chart.add_lines('lines', colors='grey', linewidths=1, zorder=-1, alpha=0.5)
+    chart.add_lines('borders', colors='black', linewidths=1, zorder=-1, alpha=0.5,
+                    linestyles='dashed')
+    chart.add_scatter('outline', color='black')
+    chart.add_scatter('stars', color='white', alpha=0.75)
+    chart.add_scatter('planets', color='green', alpha=0.65)
+    chart.add_scatter('dsos', color='red')
+    chart.add_title(fontdict={
+        'fontsize': 'large',
+        'fontweight': 'normal',
+        'color': 'black',
+        'verticalalignment': 'baseline',
+        'horizontalalignment': 'center'
+    })
+    return chart
+
+
+def render_chart(chart, layers, title, filename, stage=no_stage):
+    """Draw the ``layers`` of ``ZenithSky.layers`` on ``chart`` and save it.
+
+    The labels are placed for every chart and removed again once it is
+    saved, so that the same chart can be used for the next one.  They are
+    drawn as glyph outlines, except in vector output, where they stay
+    text.
+
+    """
+    with stage('collections'):
+        chart.set_lines('lines', layers['lines'])
+        chart.set_lines('borders', layers['borders'])
+        chart.set_scatter('outline', layers['stars'], layers['star_size'] + 5)
+        chart.set_scatter('stars', layers['stars'], layers['star_size'])
+        chart.set_scatter('planets', layers['planets'], layers['planet_size'])
+        chart.set_scatter('dsos', layers['dsos'], layers['dso_size'])
+        chart.set_text('title', title)
+
+    # Label the named stars, the planets, the DSOs and the constellations.
+    # Overlapping labels are resolved in that order of importance, brighter
+    # objects first, and the constellation names stay in the background.
+    # The label collection is not one of the chart layers, so it is not
+    # clipped at the horizon.
+
+    with stage('labelling'):
+        labels = Labeller(chart.ax, chart.limit)
+        labels.add(layers['planets'][:, 0], layers['planets'][:, 1], layers['planet_label'],
+                   priority=0, offset=(0.004, -0.004), color='green', fontsize=10, alpha=0.5)
+        labels.add(layers['named'][:, 0], layers['named'][:, 1], layers['named_label'],
+                   priority=1, rank=layers['named_magnitude'], offset=(0.004, -0.004),
+                   color='white', fontsize=5, alpha=0.5)
+        labels.add(layers['dsos'][:, 0], layers['dsos'][:, 1], layers['dso_label'],
+                   priority=2, rank=layers['dso_magnitude'], offset=(0.004, -0.004),
+                   color='red', fontsize=8, alpha=0.5)
+        labels.add(layers['centers'][:, 0], layers['centers'][:, 1], layers['center_label'],
+                   priority=3, ha='center', va='center', color='white', fontsize=35,
+                   alpha=0.20, collide=False)
+        if os.path.splitext(filename)[1].lower() in VECTOR_FORMATS:
+            drawn = labels.draw(outlines=False)
+        else:
+            drawn = [labels.draw()]
+
+    try:
+        with stage('savefig'):
+            chart.save(filename, bbox_inches='tight')
+    finally:
+        for artist in drawn:
+            artist.remove()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Chart the sky above Amsterdam.')
+    parser.add_argument('--catalog', help='plot the stars of a dense catalog converted by'
+                        ' dense_catalog.py instead of the Hipparcos stars')
+    parser.add_argument('--limiting-magnitude', type=float, default=6.0)
+    parser.add_argument('--refraction', action='store_true',
+                        help='show the objects at their refracted altitudes')
+    parser.add_argument('--extinction', type=float, nargs='?',
+                        const=horizon.EXTINCTION_COEFFICIENT,
+                        help='dim the objects by this many magnitudes per airmass'
+                             ' (default when given: %(const)s)')
+    args = parser.parse_args()
+
+    # time `t` we use for everything else.
+
+    AMS = timezone('Europe/Amsterdam')
+    ts = load.timescale()
+    t = ts.from_datetime(AMS.localize(datetime(1976, 10, 17, 5, 25, 0)))
+
+    # The chart is centered on the zenith, the last row of the rotation
+    # into the horizon frame of the site.
+
+    site = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28)
+    rotation = site.rotation_at(t)
+    zenith = rotation[2]
+
+    # An ephemeris from the JPL provides Sun and Earth positions.
+
+    eph = load('de421.bsp')
+    earth = eph['earth']
+    solar_system = SolarSystem(eph)
+
+    # The Hipparcos mission provides our star catalog.
+
+    stardata = catalog_cache.load_hipparcos()
+
+    # DSO's from stellarium
+
+    dsodata = dsos.load_catalog('data/catalog.txt')
+
+    constdata = constellation_bounds.load_boundaries()
+
+    with open('data/centers_18.txt') as fc:
+        centersdata = constellation_centers.load_dataframe(fc)
+
+    # And the constellation outlines come from Stellarium.  They are compiled
+    # into the positions in `stardata` of the star at which each edge starts,
+    # and the star at which each edge ends.
+
+    figures = constellation_figures.load('western_SnT', stardata)
+    starnames = dict(catalog_cache.load_star_names('western_SnT'))
+
+    # A dense catalog is streamed from disk and only its stars above the
+    # horizon are observed.
+
+    field = None
+    if args.catalog:
+        field = DenseCatalog(args.catalog).cone(zenith, 91.0, args.limiting_magnitude)
+
+    sky = ZenithSky(earth, t, zenith, stardata, dsodata, constdata, centersdata, figures,
+                    starnames, solar_system, field=field,
+                    limiting_magnitude=args.limiting_magnitude)
+    layers = sky.layers(rotation, site.at(t).xyz.au, refraction=args.refraction,
+                        extinction=args.extinction)
+
+    chart = chart_template()
+    render_chart(chart, layers,
+                 f"To the South in Amsterdam on {t.utc_strftime('%Y %B %d %H:%M')} UTC",
+                 'starmap.png')
+    chart.close()
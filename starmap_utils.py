@@ -1,24 +1,30 @@
+from contextlib import nullcontext
+
 from matplotlib.collections import LineCollection, PatchCollection
 from matplotlib.patches import Circle
 import numpy as np
 
 
-def generate_constellation_lines(consdata, stardata, polygon=False):
-    edges = [edge for name, edges in consdata for edge in edges]
-    edges_star1 = [star1 for star1, star2 in edges]
-    edges_star2 = [star2 for star1, star2 in edges]
-    xy1 = stardata[['x', 'y']].loc[edges_star1].values
-    xy2 = stardata[['x', 'y']].loc[edges_star2].values
+def no_stage(name):
+    """The default ``stage`` hook of the chart steps, which measures nothing.
 
-    if polygon:
-        return [xy1]
-    else:
+    benchmark.py passes its ``Stages`` instead, to time every stage.
+
+    """
+    return nullcontext()
 
-        # The constellation lines will each begin at the x,y of one star and end
-        # at the x,y of another.  We have to "rollaxis" the resulting coordinate
-        # array into the shape that matplotlib expects.
 
-        return np.rollaxis(np.array([xy1, xy2]), 1)
+def generate_constellation_lines(figures, stardata, polygon=False):
+    # The figures are compiled against stardata (see constellation_figures),
+    # so the lines are a positional take of the projected x and y.
+
+    x = stardata['x'].values
+    y = stardata['y'].values
+
+    if polygon:
+        return [np.column_stack([x, y])[figures.star1]]
+    else:
+        return figures.segments(x, y)
 
 
 def generate_constellation_borders(consdata):
@@ -26,8 +32,8 @@ def generate_constellation_borders(consdata):
     lines = [((p1['x'],p1['y']), (p2['x'],p2['y'])) for p1, p2 in edges]
     return lines
 
-def add_constellations(ax, consdata, stardata, colors):
-    constellations = LineCollection(generate_constellation_lines(consdata, stardata),
+def add_constellations(ax, figures, stardata, colors):
+    constellations = LineCollection(generate_constellation_lines(figures, stardata),
                                     colors=colors, linewidths=0.25, zorder=-1, alpha=0.5)
     ax.add_collection(constellations)
 
@@ -0,0 +1,311 @@
+"""Render the sky as a z/x/y pyramid of map tiles for a zoomable viewer.
+
+The tiles cut up the Hammer plane of the all-sky map in
+matplot-projection.py: at zoom ``z`` the 2:1 ellipse is covered by
+``2**(z+1)`` by ``2**z`` square tiles, and tile (0, 0) is the top left.
+The stars, DSOs and constellation borders are projected once; each tile
+then only draws the objects inside it, down to a magnitude limit that
+gets deeper with every zoom level.
+
+The projected points are binned once per zoom level by the tile they
+fall in, so every tile only tests the points of its own bin and of the
+bins around it, instead of the whole catalog.
+
+Generation is incremental: every tile gets a digest of what it would
+draw, kept in a manifest by ``RenderCache``, and a tile whose digest did
+not change is not rendered again.  The tiles can be rendered by worker
+processes through ``render_batch``.
+
+"""
+import argparse
+import os
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+
+import catalog_cache
+import constellation_bounds
+import dsos
+from batch_render import render_batch
+from chart_template import ChartTemplate
+from projection_engine import hammer_projection
+from render_cache import RenderCache
+
+# Half the width and height of the Hammer plane.
+
+HALF_WIDTH = 2.0 * np.sqrt(2.0)
+HALF_HEIGHT = np.sqrt(2.0)
+
+# Everything that changes how a tile looks, so that changing any of it
+# invalidates the manifest.
+
+STYLE = {
+    'version': 1,
+    'tile_size': 256,
+    'star_limit': [6.0, 1.0],
+    'dso_limit': [8.0, 1.0],
+    'star_color': 'black',
+    'dso_color': 'red',
+    'border_color': 'grey',
+}
+
+
+def magnitude_limit(z, base_and_step):
+    base, step = base_and_step
+    return base + step * z
+
+
+def tile_bounds(z, x, y):
+    """Return (x0, x1, y0, y1) of a tile in the Hammer plane."""
+    side = 2.0 * HALF_HEIGHT / 2 ** z
+    x0 = -HALF_WIDTH + x * side
+    y1 = HALF_HEIGHT - y * side
+    return x0, x0 + side, y1 - side, y1
+
+
+def tiles_at(z):
+    """Return the (z, x, y) of the tiles at zoom ``z`` that touch the sky."""
+    tiles = []
+    for y in range(2 ** z):
+        for x in range(2 ** (z + 1)):
+            x0, x1, y0, y1 = tile_bounds(z, x, y)
+
+            # The point of the tile nearest to the center, measured in
+            # the plane where the ellipse becomes the unit circle.
+
+            nx = np.clip(0.0, x0, x1) / HALF_WIDTH
+            ny = np.clip(0.0, y0, y1) / HALF_HEIGHT
+            if nx * nx + ny * ny <= 1.0:
+                tiles.append((z, x, y))
+    return tiles
+
+
+def bin_points(x, y, z):
+    """Group points by the tile of zoom ``z`` they fall in.
+
+    Returns ``(order, starts)``: the positions of the points sorted by
+    tile, keeping their original order inside every tile, and where the
+    group of the tile ``(x, y)`` starts in ``order``, at index
+    ``y * columns + x``, plus the end of the last one.
+
+    """
+    side = 2.0 * HALF_HEIGHT / 2 ** z
+    columns = 2 ** (z + 1)
+    rows = 2 ** z
+    ix = np.clip(np.floor((np.asarray(x) + HALF_WIDTH) / side).astype(int), 0, columns - 1)
+    iy = np.clip(np.floor((HALF_HEIGHT - np.asarray(y)) / side).astype(int), 0, rows - 1)
+    key = iy * columns + ix
+    order = np.argsort(key, kind='stable')
+    return order, np.searchsorted(key[order], np.arange(columns * rows + 1))
+
+
+def binned_near(bins, z, x, y, reach=1):
+    """Return the sorted positions of the points binned within ``reach`` tiles of ``(x, y)``."""
+    order, starts = bins
+    columns = 2 ** (z + 1)
+    x0 = max(x - reach, 0)
+    x1 = min(x + reach, columns - 1)
+    parts = [order[starts[row * columns + x0]:starts[row * columns + x1 + 1]]
+             for row in range(max(y - reach, 0), min(y + reach, 2 ** z - 1) + 1)]
+    return np.sort(np.concatenate(parts))
+
+
+def star_radius(magnitude, limiting_magnitude):
+    """Marker radius in points, as on the all-sky Hammer map."""
+    return 0.18 * (0.7 + limiting_magnitude - magnitude)
+
+
+class TileRenderer:
+    """The projected catalogs, cut up and drawn tile by tile."""
+
+    def __init__(self, stardata, dsodata, constdata, directory, style=STYLE):
+        self.directory = directory
+        self.style = style
+
+        self.star_x, self.star_y = hammer_projection(stardata['ra_degrees'].values,
+                                                     stardata['dec_degrees'].values)
+        self.star_magnitude = stardata['magnitude'].values
+
+        self.dso_x, self.dso_y = hammer_projection(dsodata['ra_degrees'].values,
+                                                   dsodata['dec_degrees'].values)
+        self.dso_magnitude = dsodata['magnitude'].values
+
+        # Border lines, without the ones that would run across the map
+        # from RA 0h to 24h.
+
+        border1, border2 = constellation_bounds.border_pairs(constdata)
+        ra = constdata['ra_hours'].values * 15.0
+        bx, by = hammer_projection(ra, constdata['dec_degrees'].values)
+        keep = np.abs(ra[border1] - ra[border2]) <= 180.0
+        border1, border2 = border1[keep], border2[keep]
+        self.borders = np.stack([np.column_stack([bx[border1], by[border1]]),
+                                 np.column_stack([bx[border2], by[border2]])], axis=1)
+        self.border_lo = self.borders.min(axis=1)
+        self.border_hi = self.borders.max(axis=1)
+
+        self.cache = RenderCache(directory)
+        self.chart = None
+        self.zoom_bins = {}
+
+    def bins(self, z):
+        """The stars, DSOs and borders of zoom ``z`` binned by tile, built on first use.
+
+        Only the stars and DSOs within the magnitude limits of the zoom
+        level are binned, and the borders by their midpoints.  Build the
+        bins of every zoom before forking workers, so they share them.
+
+        """
+        if z not in self.zoom_bins:
+            n_stars = np.searchsorted(self.star_magnitude,
+                                      magnitude_limit(z, self.style['star_limit']), side='right')
+            n_dsos = np.searchsorted(self.dso_magnitude,
+                                     magnitude_limit(z, self.style['dso_limit']), side='right')
+            middle = (self.border_lo + self.border_hi) / 2.0
+
+            # A border line reaches from its midpoint into the tiles within
+            # half its extent, plus the padding of ``contents``.
+
+            side = 2.0 * HALF_HEIGHT / 2 ** z
+            half_extent = (self.border_hi - self.border_lo).max(initial=0.0) / 2.0
+            pad = 8.0 * side / self.style['tile_size']
+            self.zoom_bins[z] = {
+                'stars': bin_points(self.star_x[:n_stars], self.star_y[:n_stars], z),
+                'dsos': bin_points(self.dso_x[:n_dsos], self.dso_y[:n_dsos], z),
+                'borders': bin_points(middle[:, 0], middle[:, 1], z),
+                'border_reach': int(np.ceil((half_extent + pad) / side)),
+            }
+        return self.zoom_bins[z]
+
+    def filename(self, z, x, y):
+        return os.path.join(self.directory, str(z), str(x), f'{y}.png')
+
+    def contents(self, z, x, y):
+        """Return the stars, DSOs and borders drawn on a tile."""
+        x0, x1, y0, y1 = tile_bounds(z, x, y)
+        star_limit = magnitude_limit(z, self.style['star_limit'])
+        dso_limit = magnitude_limit(z, self.style['dso_limit'])
+
+        # Objects just outside the tile can still reach into it, so pad
+        # the bounds by a few pixels.
+
+        pad = 8.0 * (x1 - x0) / self.style['tile_size']
+
+        def inside(px, py):
+            return (x0 - pad <= px) & (px <= x1 + pad) & (y0 - pad <= py) & (py <= y1 + pad)
+
+        # Only the objects binned in and around the tile, which are within
+        # the magnitude limits of the zoom level, need the bounds test.
+        # The padding is far less than a tile, so the neighbouring bins
+        # hold everything that reaches into it.
+
+        bins = self.bins(z)
+        stars = binned_near(bins['stars'], z, x, y)
+        stars = stars[inside(self.star_x[stars], self.star_y[stars])]
+        dsos = binned_near(bins['dsos'], z, x, y)
+        dsos = dsos[inside(self.dso_x[dsos], self.dso_y[dsos])]
+        borders = binned_near(bins['borders'], z, x, y, bins['border_reach'])
+        lo = self.border_lo[borders]
+        hi = self.border_hi[borders]
+        borders = borders[(lo[:, 0] <= x1 + pad) & (hi[:, 0] >= x0 - pad)
+                          & (lo[:, 1] <= y1 + pad) & (hi[:, 1] >= y0 - pad)]
+        return {
+            'stars': np.column_stack([self.star_x[stars], self.star_y[stars]]),
+            'star_radius': star_radius(self.star_magnitude[stars], star_limit),
+            'dsos': np.column_stack([self.dso_x[dsos], self.dso_y[dsos]]),
+            'dso_radius': star_radius(self.dso_magnitude[dsos], dso_limit),
+            'borders': self.borders[borders],
+        }
+
+    def template(self):
+        if self.chart is None:
+            size = self.style['tile_size'] / 100.0
+            chart = ChartTemplate(1.0, figsize=[size, size], dpi=100)
+            chart.ax.set_position([0, 0, 1, 1])
+            chart.add_lines('borders', colors=self.style['border_color'], linewidths=0.5,
+                            alpha=0.5, linestyles='dashed')
+            chart.add_scatter('stars', color=self.style['star_color'], linewidths=0)
+            chart.add_scatter('dsos', facecolors='none',
+                              edgecolors=self.style['dso_color'], linewidths=0.5)
+            self.chart = chart
+        return self.chart
+
+    def render(self, tile):
+        """Render one tile unless its contents are unchanged.
+
+        Returns ``(key, digest, rendered)``.
+
+        """
+        z, x, y = tile
+        key = f'{z}/{x}/{y}'
+        contents = self.contents(z, x, y)
+        digest = self.cache.digest([self.style, z, x, y], contents)
+        filename = self.filename(z, x, y)
+        if self.cache.fresh(key, digest, filename):
+            return key, digest, False
+
+        x0, x1, y0, y1 = tile_bounds(z, x, y)
+        chart = self.template()
+        chart.ax.set_xlim(x0, x1)
+        chart.ax.set_ylim(y0, y1)
+        chart.set_lines('borders', contents['borders'])
+        chart.set_scatter('stars', contents['stars'], (2.0 * contents['star_radius']) ** 2)
+        chart.set_scatter('dsos', contents['dsos'], (2.0 * contents['dso_radius'] + 2.0) ** 2)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        chart.save(filename, facecolor='white')
+        return key, digest, True
+
+
+# The renderer of the running pyramid, for the forked workers.
+
+_renderer = None
+
+
+def _render_tile(tile):
+    return _renderer.render(tile)
+
+
+def render_pyramid(renderer, zooms, processes=None):
+    """Render every tile of the given zoom levels and update the manifest.
+
+    Yields ``(key, rendered)`` for every tile, in order.
+
+    """
+    global _renderer
+    zooms = list(zooms)
+    tiles = [tile for z in zooms for tile in tiles_at(z)]
+    for z in zooms:
+        renderer.bins(z)
+    _renderer = renderer
+    try:
+        for key, digest, rendered in render_batch(_render_tile, tiles, processes):
+            renderer.cache.record(key, digest)
+            yield key, rendered
+    finally:
+        _renderer = None
+        renderer.cache.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render a z/x/y pyramid of sky tiles.')
+    parser.add_argument('--output', default='tiles', help='tile directory (default: %(default)s)')
+    parser.add_argument('--min-zoom', type=int, default=0)
+    parser.add_argument('--max-zoom', type=int, default=3)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='number of worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    stardata = catalog_cache.load_hipparcos()
+    dsodata = dsos.load_catalog('data/catalog.txt', catalogs=None)
+    constdata = constellation_bounds.load_boundaries()
+
+    os.makedirs(args.output, exist_ok=True)
+    renderer = TileRenderer(stardata, dsodata, constdata, args.output)
+    rendered = skipped = 0
+    for key, done in render_pyramid(renderer, range(args.min_zoom, args.max_zoom + 1),
+                                    args.processes):
+        if done:
+            rendered += 1
+        else:
+            skipped += 1
+    print(f'{rendered} tiles rendered, {skipped} unchanged')
@@ -0,0 +1,189 @@
+"""Render the all-sky chart of starmap.py for a whole series of epochs.
+
+Over one night the apparent places of the stars and DSOs barely change:
+proper motion, precession and aberration move them by well under an
+arcsecond.  So they are observed once, at the middle epoch, and kept as
+unit vectors.  What does change from frame to frame is the direction of
+the zenith, which is computed for every epoch in one vectorized call,
+and the planets, which are observed in one call per body over the
+whole Time array.  Each frame is then only a 3x3 rotation of the cached
+vectors plus updating the layers of a ``ChartTemplate`` that is built
+once.
+
+"""
+import argparse
+import os
+import subprocess
+from datetime import datetime
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from pytz import timezone
+from skyfield.api import load, wgs84, N, E
+
+import catalog_cache
+import constellation_bounds
+import constellation_figures
+import dsos
+from chart_template import ChartTemplate
+from projection_engine import ProjectionEngine, SkyTable, project_vectors, unit_vectors
+from solar_system import SolarSystem, marker_size as planet_marker_size
+
+
+class TimeSweep:
+    """Cached geometry for rendering the sky of one site over many epochs."""
+
+    def __init__(self, earth, site, times, stardata, dsodata, constdata, figures,
+                 solar_system, limiting_magnitude=6.0, dso_limit_magnitude=8.0):
+        self.times = times
+        self.limiting_magnitude = limiting_magnitude
+        self.dso_limit_magnitude = dso_limit_magnitude
+
+        # The zenith for every epoch, in a single call.
+
+        self.zenith = unit_vectors(
+            site.at(times).from_altaz(alt_degrees=90, az_degrees=0.0))
+
+        # Stars bright enough to plot anywhere in the sky, plus the stars
+        # of the constellation figures, observed once at the middle epoch.
+        # The catalog is sorted by magnitude, so the bright stars are the
+        # first ``n`` rows and stay the first ``n`` of the observed ones.
+
+        observer = earth.at(times[len(times) // 2])
+        n = catalog_cache.brighter_than(stardata, limiting_magnitude)
+        observed = np.union1d(np.arange(n), figures.stars)
+        stars = stardata.iloc[observed]
+        self.bright = slice(0, n)
+        self.star_size = (0.7 + limiting_magnitude - stars['magnitude'].values[:n]) ** 2.0
+
+        # Every figure star is among the observed ones, so the compiled
+        # edges map straight onto positions in the observed subset.
+
+        self.line_star1 = np.searchsorted(observed, figures.star1)
+        self.line_star2 = np.searchsorted(observed, figures.star2)
+
+        bright_dsos = dsodata.iloc[:catalog_cache.brighter_than(dsodata, dso_limit_magnitude)]
+        self.dso_size = (0.9 + dso_limit_magnitude - bright_dsos['magnitude'].values) ** 2.0
+
+        # The stars, DSOs and border points are observed together, and
+        # every frame projects them with a single rotation.
+
+        self.sky = SkyTable({'stars': stars, 'dsos': bright_dsos, 'borders': constdata})
+        self.engine = ProjectionEngine(observer, self.sky.columns)
+        self.border1, self.border2 = constellation_bounds.border_pairs(constdata)
+
+        # The planets move, so they are observed over the whole Time
+        # array at once rather than once per frame.
+
+        self.planet_names = solar_system.names
+        self.planets, planet_magnitude, self.planet_phase = solar_system.observe(times)
+        self.planet_size = planet_marker_size(planet_magnitude, limiting_magnitude)
+
+    def __len__(self):
+        return len(self.times)
+
+    def frame(self, i):
+        """Return the projected layers of frame ``i`` as a dict of arrays."""
+        center = self.zenith[:, i]
+        xy = np.column_stack(self.engine.project(center))
+        stars = xy[self.sky.rows('stars')]
+        borders = xy[self.sky.rows('borders')]
+        return {
+            'stars': stars[self.bright],
+            'lines': np.stack([stars[self.line_star1], stars[self.line_star2]], axis=1),
+            'borders': np.stack([borders[self.border1], borders[self.border2]], axis=1),
+            'dsos': xy[self.sky.rows('dsos')],
+            'planets': np.column_stack(project_vectors(center, self.planets[:, :, i])),
+        }
+
+    def build_template(self, size=12, dpi=100):
+        """Create the chart whose layers every frame updates."""
+        chart = ChartTemplate(1.0, figsize=[size, size], dpi=dpi)
+        chart.add_horizon()
+        chart.add_lines('lines', colors='grey', linewidths=1, zorder=-1, alpha=0.5)
+        chart.add_lines('borders', colors='black', linewidths=1, zorder=-1,
+                        alpha=0.5, linestyles='dashed')
+        chart.add_scatter('outline', color='black')
+        chart.add_scatter('stars', color='white', alpha=0.75)
+        chart.add_scatter('planets', color='green', alpha=0.65)
+        chart.add_scatter('dsos', color='red')
+        chart.add_title()
+        return chart
+
+    def update(self, chart, i):
+        """Move the layers of ``build_template`` to frame ``i``."""
+        layers = self.frame(i)
+        chart.set_lines('lines', layers['lines'])
+        chart.set_lines('borders', layers['borders'])
+        chart.set_scatter('outline', layers['stars'], self.star_size + 5)
+        chart.set_scatter('stars', layers['stars'], self.star_size)
+        chart.set_scatter('planets', layers['planets'], self.planet_size[:, i])
+        chart.set_scatter('dsos', layers['dsos'], self.dso_size)
+        chart.set_text('title', self.times[i].utc_strftime('%Y %B %d %H:%M UTC'))
+
+    def render(self, pattern='frames/frame-{:04d}.png', video=None, fps=25, **kwargs):
+        """Render every frame to PNG files, or pipe them into ffmpeg.
+
+        With ``video`` set to an output filename the frames are streamed
+        as raw RGBA into ``ffmpeg`` instead of being written to disk.
+
+        """
+        chart = self.build_template(**kwargs)
+        fig = chart.fig
+        encoder = None
+        if video is not None:
+            width, height = fig.canvas.get_width_height()
+            encoder = subprocess.Popen([
+                'ffmpeg', '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgba', '-s', f'{width}x{height}',
+                '-r', str(fps), '-i', '-', '-pix_fmt', 'yuv420p', video,
+            ], stdin=subprocess.PIPE)
+        else:
+            os.makedirs(os.path.dirname(pattern) or '.', exist_ok=True)
+
+        try:
+            for i in range(len(self)):
+                self.update(chart, i)
+                if encoder is None:
+                    fig.savefig(pattern.format(i))
+                else:
+                    fig.canvas.draw()
+                    encoder.stdin.write(fig.canvas.buffer_rgba())
+        finally:
+            chart.close()
+            if encoder is not None:
+                encoder.stdin.close()
+                encoder.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the all-sky chart for every minute of a night.')
+    parser.add_argument('--start', default='2022-01-19T20:00',
+                        help='local start time in Amsterdam (default: %(default)s)')
+    parser.add_argument('--hours', type=float, default=10.0)
+    parser.add_argument('--step', type=float, default=1.0, help='minutes between frames')
+    parser.add_argument('--frames', default='frames/frame-{:04d}.png',
+                        help='filename pattern for the PNG frames')
+    parser.add_argument('--video', help='stream the frames into ffmpeg instead, e.g. night.mp4')
+    parser.add_argument('--fps', type=int, default=25)
+    args = parser.parse_args()
+
+    AMS = timezone('Europe/Amsterdam')
+    ts = load.timescale()
+    start = ts.from_datetime(AMS.localize(datetime.fromisoformat(args.start)))
+    minutes = np.arange(0.0, args.hours * 60.0, args.step)
+    times = ts.tt_jd(start.tt + minutes / 1440.0)
+
+    eph = load('de421.bsp')
+    solar_system = SolarSystem(eph)
+
+    stardata = catalog_cache.load_hipparcos()
+    dsodata = dsos.load_catalog('data/catalog.txt')
+    constdata = constellation_bounds.load_boundaries()
+    figures = constellation_figures.load('western_SnT', stardata)
+
+    amsterdam = wgs84.latlon(52.377956*N, 4.897070*E, elevation_m=28)
+    sweep = TimeSweep(eph['earth'], amsterdam, times, stardata, dsodata,
+                      constdata, figures, solar_system)
+    sweep.render(args.frames, video=args.video, fps=args.fps)